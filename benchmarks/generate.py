@@ -0,0 +1,92 @@
+import argparse
+import os
+from random import Random
+
+from models import Player, Round, Tournament, TournamentEntry
+
+
+# Syllables the synthetic names are built from: enough combinations for
+# realistic sorting and few enough to share strings like real lists do.
+SYLLABLES = ('ka', 'lo', 'mi', 'ra', 'ne', 'to', 'vi', 'su', 'de', 'an',
+             'bel', 'cor', 'dur', 'fen', 'gar', 'hol', 'jan', 'kov', 'lin',
+             'mor', 'nov', 'pet', 'ros', 'sch', 'tar', 'val', 'wen', 'zim')
+
+SECTION_SIZE = 40
+NUM_ROUNDS = 7
+
+
+def name(rng, syllables):
+    return ''.join(rng.choice(SYLLABLES)
+                   for _ in range(syllables)).capitalize()
+
+
+def generate_players(n, seed=0):
+    # The same n and seed always give the same players, in the same
+    # order; chess IDs are BM0000001 and up.
+    rng = Random(seed)
+    for i in range(1, n + 1):
+        yield Player(name(rng, rng.randint(2, 4)), name(rng, 2),
+                     f'{rng.randint(1940, 2015)}-{rng.randint(1, 12):02d}-'
+                     f'{rng.randint(1, 28):02d}',
+                     f'BM{i:07d}')
+
+
+def play_rounds(tournament, rounds, rng):
+    # Pairs and scores rounds at random, the way a finished event ends up.
+    for round_num in range(len(tournament.rounds),
+                           len(tournament.rounds) + rounds):
+        seed = rng.randrange(2 ** 32)
+        tournament.append_round(Round(
+            f"Round {round_num + 1}", f"2024-01-01T{10 + round_num}:00:00",
+            f"2024-01-01T{11 + round_num}:00:00",
+            tournament.generate_matches(seed=seed), seed
+        ))
+        for match in tournament.rounds[round_num].matches:
+            match.apply_result('1' if match.is_bye
+                               else rng.choice('1123'))
+
+
+def generate_tournament(players, rng, num_rounds=NUM_ROUNDS,
+                        rounds_played=None, index=0):
+    # A section of the given players with rounds_played rounds (all of
+    # them by default) paired and scored.
+    tournament = Tournament(
+        f"Open {index + 1}", name(rng, 3), '2024-01-01', '2024-01-07',
+        num_rounds,
+        players=[TournamentEntry.from_player(player) for player in players],
+        tournament_id=f'{rng.getrandbits(128):032x}'
+    )
+    play_rounds(tournament, num_rounds if rounds_played is None
+                else rounds_played, rng)
+    tournament.current_round = len(tournament.rounds) + 1
+    return tournament
+
+
+def generate_archive(players, count, seed=0, section_size=SECTION_SIZE,
+                     num_rounds=NUM_ROUNDS):
+    # count finished tournaments, each drawing its section from players.
+    rng = Random(seed)
+    section_size = min(section_size, len(players))
+    for index in range(count):
+        yield generate_tournament(rng.sample(players, section_size), rng,
+                                  num_rounds, index=index)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic players.json and tournaments.json.")
+    parser.add_argument('directory')
+    parser.add_argument('--players', type=int, default=10000)
+    parser.add_argument('--tournaments', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    players = list(generate_players(args.players, args.seed))
+    tournaments = list(generate_archive(players, args.tournaments,
+                                        args.seed))
+    os.chdir(args.directory)
+    Player.save_players(players)
+    Tournament.save_tournaments(tournaments)
+    print(f"{len(players)} players and {len(tournaments)} tournaments "
+          f"written to {args.directory}.")
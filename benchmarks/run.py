@@ -0,0 +1,250 @@
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+from random import Random
+
+from benchmarks.generate import (generate_archive, generate_players,
+                                 generate_tournament)
+from models import Player, Tournament
+from rendering import PAGE_SIZE, Pager
+from storage import JsonPlayerStorage
+from tiebreaks import numpy
+from views import View
+
+
+# Benchmarks of the hot paths against synthetic data. Run from the
+# repository root, e.g.
+#     python -m benchmarks.run --sizes 1000,100000 --output report.json
+# and compare with an earlier report using --baseline.
+
+SIZES = (1000, 10000, 100000)
+TOURNAMENTS = 1000
+# Largest section paired by the pairing benchmarks.
+MAX_SECTION = 1000
+PAIRING_ROUNDS = 5
+REPEAT = 5
+# A p50 latency this much slower than the baseline is a regression.
+TOLERANCE = 0.25
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list.
+    index = max(0, min(len(sorted_values) - 1,
+                       round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def measure(name, size, items, run, repeat=REPEAT, setup=None):
+    # Times run() repeat times, then once more under tracemalloc for the
+    # peak memory; setup(), when given, runs untimed before each call.
+    # items is what one call processes, for the throughput.
+    latencies = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        started = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - started)
+
+    if setup is not None:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    p50 = percentile(latencies, 0.5)
+    return {
+        'name': name,
+        'size': size,
+        'items': items,
+        'repeat': repeat,
+        'throughput': items / p50 if p50 else None,
+        'latency_ms': {
+            'min': latencies[0] * 1000,
+            'p50': p50 * 1000,
+            'p90': percentile(latencies, 0.9) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'max': latencies[-1] * 1000,
+        },
+        'peak_memory_bytes': peak,
+    }
+
+
+def player_benchmarks(size, seed, repeat):
+    players = list(generate_players(size, seed))
+    yield measure('save_players', size, size,
+                  lambda: Player.save_players(players), repeat)
+    yield measure('load_players', size, size, Player.load_players, repeat)
+
+    storage = JsonPlayerStorage()
+    output = io.StringIO()
+    with redirect_stdout(output):
+        view = View(None)
+    view.pager = Pager(out=output)
+
+    def list_players(limit=None):
+        def run():
+            with redirect_stdout(output):
+                view.list_players(storage.iter_players(limit=limit))
+        return run
+
+    def rewind():
+        output.seek(0)
+        output.truncate()
+
+    # The first listing builds the sorted index; the timed ones reuse it
+    # like every listing after it does.
+    list_players(1)()
+    yield measure('list_players_first_page', size, min(size, PAGE_SIZE),
+                  list_players(PAGE_SIZE), repeat, rewind)
+    yield measure('list_players', size, size, list_players(), repeat,
+                  rewind)
+
+
+def tournament_benchmarks(size, count, seed, repeat):
+    players = list(generate_players(size, seed))
+    tournaments = list(generate_archive(players, count, seed))
+    games = sum(len(round_data.matches) for tournament in tournaments
+                for round_data in tournament.rounds)
+    yield measure('save_tournaments', size, games,
+                  lambda: Tournament.save_tournaments(tournaments), repeat)
+    yield measure('load_tournaments', size, games,
+                  Tournament.load_tournaments, repeat)
+
+    output = io.StringIO()
+    with redirect_stdout(output):
+        view = View(None)
+    view.pager = Pager(out=output)
+    tournament = tournaments[0]
+
+    def summary():
+        output.seek(0)
+        output.truncate()
+        with redirect_stdout(output):
+            view.summary_rounds(tournament)
+    yield measure('summary_rounds', size, len(tournament.players), summary,
+                  repeat)
+
+
+def pairing_benchmarks(size, seed, repeat):
+    rng = Random(seed)
+    section = min(size, MAX_SECTION)
+    players = list(generate_players(section, seed))
+    # A section halfway through, so the pairings have a history to avoid.
+    tournament = generate_tournament(players, rng, PAIRING_ROUNDS * 2,
+                                     PAIRING_ROUNDS)
+    yield measure('generate_matches', size, section,
+                  lambda: tournament.generate_matches(seed=seed), repeat)
+    yield measure('generate_swiss_system_matches', size, section,
+                  tournament.generate_swiss_system_matches, repeat)
+
+
+def run(sizes=SIZES, tournaments=TOURNAMENTS, seed=0, repeat=REPEAT,
+        only=None):
+    # Works in a temporary directory, since the models read and write
+    # players.json and tournaments.json in the current one.
+    suites = {
+        'players': lambda size: player_benchmarks(size, seed, repeat),
+        'tournaments': lambda size: tournament_benchmarks(
+            size, tournaments, seed, repeat),
+        'pairing': lambda size: pairing_benchmarks(size, seed, repeat),
+    }
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            for size in sizes:
+                for suite, benchmarks in suites.items():
+                    if only and suite not in only:
+                        continue
+                    for result in benchmarks(size):
+                        result['suite'] = suite
+                        results.append(result)
+                        p50 = result['latency_ms']['p50']
+                        print(f"{suite:<12} {result['name']:<30} "
+                              f"{size:>8} {p50:>10.2f} ms", file=sys.stderr)
+        finally:
+            os.chdir(cwd)
+    return {
+        'created': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': numpy is not None,
+        'seed': seed,
+        'repeat': repeat,
+        'tournaments': tournaments,
+        'results': results,
+    }
+
+
+def regressions(report, baseline, tolerance=TOLERANCE):
+    # [(suite, name, size, baseline p50, p50)] for every benchmark whose
+    # p50 latency grew by more than tolerance since the baseline.
+    before = {(result['suite'], result['name'], result['size']):
+              result['latency_ms']['p50'] for result in baseline['results']}
+    slower = []
+    for result in report['results']:
+        key = (result['suite'], result['name'], result['size'])
+        p50 = result['latency_ms']['p50']
+        if key in before and p50 > before[key] * (1 + tolerance):
+            slower.append(key + (before[key], p50))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.run',
+        description="Time the hot paths on synthetic data.")
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)),
+                        help="comma separated player counts, up to "
+                             "1000000")
+    parser.add_argument('--tournaments', type=int, default=TOURNAMENTS)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', help="comma separated suites: players, "
+                                       "tournaments, pairing")
+    parser.add_argument('--output', help="write the JSON report here "
+                                         "instead of standard output")
+    parser.add_argument('--baseline', help="an earlier report to compare "
+                                           "with")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    report = run([int(size) for size in args.sizes.split(',')],
+                 args.tournaments, args.seed, args.repeat,
+                 args.only.split(',') if args.only else None)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            slower = regressions(report, json.load(f), args.tolerance)
+        for suite, name, size, before, after in slower:
+            print(f"Regression: {suite} {name} at {size}: "
+                  f"{before:.2f} ms -> {after:.2f} ms", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
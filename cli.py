@@ -0,0 +1,353 @@
+import argparse
+import json
+import sys
+from datetime import datetime
+
+from importer import import_players, parse_chess_ids, parse_results
+from models import PAIRING_SYSTEMS, Round, Tournament, TournamentEntry
+from pairing import PairingError
+from ratings import RatingTable
+from rendering import write_lines
+from sections import pair_next_rounds, ready_to_pair
+from storage import open_storage
+from tiebreaks import TIEBREAKS
+from trf import read_trf, write_trf
+
+
+# Scriptable counterpart of the menus in controller.py: every subcommand
+# works on the model layer directly and prints either text or, with
+# --json, one JSON document.
+
+
+def find_tournament(storage, key):
+    # A tournament id, or any prefix of one that is not ambiguous.
+    tournament = storage.load_tournament(key)
+    if tournament is not None:
+        return tournament
+    matches = [summary.tournament_id
+               for summary in storage.list_tournaments()
+               if summary.tournament_id.startswith(key)]
+    if len(matches) != 1:
+        raise ValueError(f"No tournament {key!r}." if not matches else
+                         f"Tournament id {key!r} is ambiguous.")
+    return storage.load_tournament(matches[0])
+
+
+def match_data(board, match):
+    return {
+        'board': board,
+        'white': match.player1.chess_id,
+        'black': match.player2.chess_id if match.player2 else None,
+        'result': match.result,
+    }
+
+
+def update_ratings(args, storage):
+    if args.no_ratings:
+        return
+    ratings = RatingTable.load()
+    if ratings.update(storage):
+        ratings.save()
+
+
+def players_import(args, storage):
+    report = import_players(storage, args.file, encoding=args.encoding)
+    data = report._asdict()
+    data['rejected_rows'] = [list(row) for row in report.rejected_rows]
+    return data
+
+
+def players_import_text(data):
+    yield (f"{data['read']} rows read: {data['added']} added, "
+           f"{data['updated']} updated, {data['unchanged']} unchanged, "
+           f"{data['duplicates']} duplicates, {data['rejected']} rejected.")
+    for line_number, reason in data['rejected_rows']:
+        yield f"Line {line_number}: {reason}"
+
+
+def players_list(args, storage):
+    players = storage.iter_players(args.offset, args.limit, args.search)
+    if args.json:
+        return [player.to_dict() for player in players]
+    # Text output is streamed rather than collected first.
+    return players
+
+
+def players_list_text(players):
+    for player in players:
+        yield (f"{player.chess_id}  {player.last_name}, "
+               f"{player.first_name}  {player.birth_date}")
+
+
+def tournament_list(args, storage):
+    return [summary._asdict() for summary in storage.list_tournaments()]
+
+
+def tournament_list_text(data):
+    for summary in data:
+        yield (f"{summary['tournament_id']}  {summary['name']} "
+               f"({summary['location']}), {summary['status']}")
+
+
+def tournament_create(args, storage):
+    tournament = Tournament(args.name, args.location, args.start_date,
+                            args.end_date, args.rounds,
+                            pairing_system=args.system)
+    storage.add_tournament(tournament)
+    return {'tournament_id': tournament.tournament_id}
+
+
+def tournament_create_text(data):
+    yield data['tournament_id']
+
+
+def tournament_register(args, storage):
+    tournament = find_tournament(storage, args.tournament)
+    if tournament.rounds:
+        raise ValueError(f"{tournament.name} has already started.")
+    chess_ids = list(dict.fromkeys(parse_chess_ids(' '.join(args.players))))
+    found = storage.get_players(chess_ids)
+    missing = [chess_id for chess_id in chess_ids if chess_id not in found]
+    if missing:
+        raise ValueError("Players not found: " + ", ".join(missing))
+    tournament.register([TournamentEntry.from_player(found[chess_id])
+                         for chess_id in chess_ids])
+    return {'tournament_id': tournament.tournament_id,
+            'registered': len(chess_ids)}
+
+
+def tournament_register_text(data):
+    yield f"{data['registered']} players registered."
+
+
+def tournament_import(args, storage):
+    with open(args.file, 'r', encoding=args.encoding) as f:
+        tournament = read_trf(f)
+    storage.add_tournament(tournament)
+    return {'tournament_id': tournament.tournament_id,
+            'players': len(tournament.players),
+            'rounds': len(tournament.rounds)}
+
+
+def tournament_import_text(data):
+    yield (f"{data['tournament_id']}: {data['players']} players, "
+           f"{data['rounds']} rounds.")
+
+
+def tournament_export(args, storage):
+    tournament = find_tournament(storage, args.tournament)
+    if args.file == '-':
+        write_trf(tournament, sys.stdout)
+    else:
+        with open(args.file, 'w', encoding='utf-8') as f:
+            write_trf(tournament, f)
+    return None
+
+
+def round_pair(args, storage):
+    if args.all:
+        report, errors = pair_next_rounds(storage, args.workers)
+        data = report._asdict()
+        data['errors'] = errors
+        return data
+
+    paired = []
+    for key in args.tournaments:
+        tournament = find_tournament(storage, key)
+        if not ready_to_pair(tournament):
+            raise ValueError(f"{tournament.name} has no round to pair.")
+        round_data = Round(f"Round {len(tournament.rounds) + 1}",
+                           datetime.now().isoformat(),
+                           matches=tournament.generate_next_matches())
+        tournament.add_round(round_data)
+        paired.append({
+            'tournament_id': tournament.tournament_id,
+            'round': len(tournament.rounds),
+            'matches': [match_data(board, match) for board, match
+                        in enumerate(round_data.matches, start=1)],
+        })
+    return paired
+
+
+def round_pair_text(data):
+    if isinstance(data, dict):
+        yield (f"Paired {data['paired']} of {data['sections']} sections in "
+               f"{data['seconds']:.2f}s "
+               f"({data['sections_per_second']:.1f} sections/s).")
+        for tournament_id, error in data['errors'].items():
+            yield f"Could not pair {tournament_id}: {error}"
+        return
+    for section in data:
+        yield f"{section['tournament_id']} round {section['round']}:"
+        for match in section['matches']:
+            yield (f"{match['board']:>4}  {match['white']} - "
+                   f"{match['black'] or 'bye'}")
+
+
+def round_results(args, storage):
+    tournament = find_tournament(storage, args.tournament)
+    if not tournament.rounds:
+        raise ValueError(f"{tournament.name} has not started.")
+    if args.file == '-':
+        results = parse_results(sys.stdin)
+    else:
+        with open(args.file, 'r') as f:
+            results = parse_results(f)
+    missing = tournament.enter_results(len(tournament.rounds) - 1, results)
+    if not missing:
+        update_ratings(args, storage)
+    return {'tournament_id': tournament.tournament_id,
+            'round': len(tournament.rounds),
+            'entered': len(results), 'missing': missing}
+
+
+def round_results_text(data):
+    yield f"{data['entered']} results entered."
+    if data['missing']:
+        yield ("Boards still without a result: "
+               + ", ".join(map(str, data['missing'])))
+    else:
+        yield "Round finished."
+
+
+def standings(args, storage):
+    if args.all:
+        keys = [summary.tournament_id
+                for summary in storage.list_tournaments()]
+    else:
+        keys = args.tournaments
+    tables = []
+    for key in keys:
+        tournament = find_tournament(storage, key)
+        ranked = tournament.standings
+        tables.append({
+            'tournament_id': tournament.tournament_id,
+            'name': tournament.name,
+            'standings': [
+                dict({'rank': rank, 'chess_id': player.chess_id,
+                      'name': f"{player.first_name} {player.last_name}",
+                      'score': player.score},
+                     **dict(zip(TIEBREAKS, ranked.tiebreak(player))))
+                for rank, player in enumerate(
+                    ranked.top(args.top) if args.top else ranked, start=1)
+            ],
+        })
+    return tables
+
+
+def standings_text(data):
+    for table in data:
+        yield f"{table['name']} ({table['tournament_id']})"
+        yield ("Rank  Player                          Score    Bh   MBh"
+               "    SB   Cum")
+        for row in table['standings']:
+            yield "{:>4}  {:<30} {:>6} {:>5} {:>5} {:>5} {:>5}".format(
+                row['rank'], row['name'][:30], row['score'],
+                *(f"{row[name]:g}" for name in TIEBREAKS)
+            )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='cli.py', description="Chess tournament manager.")
+    parser.add_argument('--storage', metavar='PATH',
+                        help="a .db file for SQLite or a directory of "
+                             "shards; tournaments.json by default")
+    parser.add_argument('--json', action='store_true',
+                        help="print the result as JSON")
+    parser.add_argument('--no-ratings', action='store_true',
+                        help="do not update ratings.json")
+    groups = parser.add_subparsers(dest='group', required=True)
+
+    players = groups.add_parser('players').add_subparsers(
+        dest='command', required=True)
+    command = players.add_parser('import', help="import a player list")
+    command.add_argument('file', help="CSV or FIDE fixed width list")
+    command.add_argument('--encoding', default='utf-8')
+    command.set_defaults(run=players_import, text=players_import_text)
+    command = players.add_parser('list', help="list players by last name")
+    command.add_argument('--search', help="text in the name or chess ID")
+    command.add_argument('--offset', type=int, default=0)
+    command.add_argument('--limit', type=int)
+    command.set_defaults(run=players_list, text=players_list_text)
+
+    tournament = groups.add_parser('tournament').add_subparsers(
+        dest='command', required=True)
+    command = tournament.add_parser('list', help="list tournaments")
+    command.set_defaults(run=tournament_list, text=tournament_list_text)
+    command = tournament.add_parser('create', help="create a tournament")
+    command.add_argument('name')
+    command.add_argument('--location', default='')
+    command.add_argument('--start-date', default='', metavar='YYYY-MM-DD')
+    command.add_argument('--end-date', default='', metavar='YYYY-MM-DD')
+    command.add_argument('--rounds', type=int, default=4,
+                         help="for Swiss; a round-robin plays its schedule")
+    command.add_argument('--system', choices=PAIRING_SYSTEMS,
+                         default='swiss', help="pairing system")
+    command.set_defaults(run=tournament_create, text=tournament_create_text)
+    command = tournament.add_parser('register', help="register players")
+    command.add_argument('tournament', help="tournament id or id prefix")
+    command.add_argument('players', nargs='+',
+                         help="chess IDs, ranges such as AB00001-AB00020 "
+                              "or @file")
+    command.set_defaults(run=tournament_register,
+                         text=tournament_register_text)
+    command = tournament.add_parser('import', help="import a TRF file")
+    command.add_argument('file')
+    command.add_argument('--encoding', default='utf-8')
+    command.set_defaults(run=tournament_import, text=tournament_import_text)
+    command = tournament.add_parser('export', help="export as a TRF file")
+    command.add_argument('tournament')
+    command.add_argument('file', help="'-' for standard output")
+    command.set_defaults(run=tournament_export, text=None)
+
+    round_parser = groups.add_parser('round').add_subparsers(
+        dest='command', required=True)
+    command = round_parser.add_parser('pair', help="pair the next round")
+    targets = command.add_mutually_exclusive_group(required=True)
+    targets.add_argument('tournaments', nargs='*', default=[])
+    targets.add_argument('--all', action='store_true',
+                         help="every tournament ready for its next round")
+    command.add_argument('--workers', type=int)
+    command.set_defaults(run=round_pair, text=round_pair_text)
+    command = round_parser.add_parser(
+        'results', help="enter results of the current round")
+    command.add_argument('tournament')
+    command.add_argument('file', nargs='?', default='-',
+                         help="'board result' lines; standard input by "
+                              "default")
+    command.set_defaults(run=round_results, text=round_results_text)
+
+    command = groups.add_parser('standings', help="show standings")
+    targets = command.add_mutually_exclusive_group(required=True)
+    targets.add_argument('tournaments', nargs='*', default=[])
+    targets.add_argument('--all', action='store_true')
+    command.add_argument('--top', type=int, metavar='N')
+    command.set_defaults(run=standings, text=standings_text, command=None)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    storage = open_storage(args.storage)
+    try:
+        data = args.run(args, storage)
+        # Output may still be read from the storage, so it is written
+        # before the storage is closed.
+        if args.json:
+            if data is not None:
+                json.dump(data, sys.stdout, indent=4)
+                print()
+        elif args.text is not None:
+            write_lines(args.text(data))
+    except (ValueError, OSError, PairingError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        storage.checkpoint()
+        storage.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
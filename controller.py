@@ -1,12 +1,16 @@
-from models import Player, Tournament
+import sys
+
+from ratings import RatingTable
+from sections import pair_next_rounds
+from storage import JsonStorage, open_storage
 from views import View
 
 
 class Controller:
-    def __init__(self):
-        self.players = Player.load_players()
-        self.tournaments = Tournament.load_tournaments()
+    def __init__(self, storage=None):
+        self.storage = storage if storage is not None else JsonStorage()
         self.view = View(self)
+        self.ratings = RatingTable.load()
 
     def run(self):
         while True:
@@ -34,61 +38,109 @@ class Controller:
             elif choice == '10':
                 self.summary_rounds()
             elif choice == '11':
+                self.pair_all_tournaments()
+            elif choice == '12':
+                self.storage.close()
                 break
             else:
                 print("Invalid choice. Please try again.")
 
+    def find_player(self, chess_id):
+        return self.storage.get_player(chess_id)
+
+    def find_players(self, chess_ids):
+        # {chess_id: player} for the ids found, through the storage's
+        # chess_id index.
+        return self.storage.get_players(chess_ids)
+
+    def select_tournament(self):
+        tournaments = self.storage.list_tournaments()
+        self.view.list_tournaments(tournaments)
+        if not tournaments:
+            return None
+
+        tournament_index = int(input("Enter tournament index: ")) - 1
+        if tournament_index < 0 or tournament_index >= len(tournaments):
+            print("Invalid tournament index.")
+            return None
+
+        return self.storage.load_tournament(
+            tournaments[tournament_index].tournament_id
+        )
+
     def create_player(self):
         player = self.view.create_player()
-        self.players.append(player)
-        Player.save_players(self.players)
+        self.storage.add_player(player)
 
     def list_players(self):
-        self.view.list_players(self.players)
+        search, offset = self.view.player_list_options()
+        self.view.list_players(self.storage.iter_players(offset,
+                                                         search=search),
+                               start=offset + 1)
 
     def modify_player(self):
-        self.view.modify_player(self.players)
-        Player.save_players(self.players)
+        chess_id = input("Enter the national chess ID of the player you "
+                         "want to modify: ").strip()
+        player = self.find_player(chess_id)
+        if not player:
+            print(f"Player with ID {chess_id} not found.")
+            return
+
+        self.view.modify_player(player)
+        self.storage.update_player(chess_id, player)
 
     def create_tournament(self):
         tournament = self.view.create_tournament()
-        self.tournaments.append(tournament)
-        Tournament.save_tournaments(self.tournaments)
+        self.storage.add_tournament(tournament)
 
     def modify_tournament(self):
-        self.view.modify_tournament(self.tournaments)
-        Tournament.save_tournaments(self.tournaments)
+        tournament = self.select_tournament()
+        if tournament:
+            self.view.modify_tournament(tournament)
+            self.storage.checkpoint()
 
     def register_players(self):
-        self.view.list_tournaments(self.tournaments)
-        tournament_index = int(input("Enter tournament index: ")) - 1
-        self.view.register_players(self.tournaments[tournament_index])
-        Tournament.save_tournaments(self.tournaments)
+        tournament = self.select_tournament()
+        if tournament:
+            self.view.register_players(tournament)
+            self.storage.checkpoint()
 
     def launch_tournament(self):
-        self.view.list_tournaments(self.tournaments)
-        tournament_index = int(input("Enter tournament index: ")) - 1
-        self.view.launch_tournament(self.tournaments[tournament_index])
-        Tournament.save_tournaments(self.tournaments)
+        tournament = self.select_tournament()
+        if tournament:
+            self.view.launch_tournament(tournament)
+            self.storage.checkpoint()
+            self.update_ratings()
 
     def show_ongoing_matches(self):
-        self.view.list_tournaments(self.tournaments)
-        tournament_index = int(input("Enter tournament index: ")) - 1
-        self.view.show_ongoing_matches(self.tournaments[tournament_index])
+        tournament = self.select_tournament()
+        if tournament:
+            self.view.show_ongoing_matches(tournament)
 
     def enter_match_results(self):
-        self.view.list_tournaments(self.tournaments)
-        tournament_index = int(input("Enter tournament index: ")) - 1
-        self.view.enter_match_results(self.tournaments[tournament_index])
-        Tournament.save_tournaments(self.tournaments)
+        tournament = self.select_tournament()
+        if tournament:
+            self.view.enter_match_results(tournament)
+            self.storage.checkpoint()
+            self.update_ratings()
+
+    def update_ratings(self):
+        if self.ratings.update(self.storage):
+            self.ratings.save()
+
+    def pair_all_tournaments(self):
+        report, errors = pair_next_rounds(self.storage)
+        self.view.pairing_report(report, errors)
+        self.storage.checkpoint()
 
     def summary_rounds(self):
-        self.view.list_tournaments(self.tournaments)
-        tournament_index = int(input("Enter tournament index: ")) - 1
-        self.view.summary_rounds(self.tournaments[tournament_index])
+        tournament = self.select_tournament()
+        if tournament:
+            self.view.summary_rounds(tournament)
 
 
 if __name__ == '__main__':
-    controller = Controller()
+    controller = Controller(open_storage(sys.argv[1] if len(sys.argv) > 1
+                                         else None))
     controller.run()
     print("\n")
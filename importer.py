@@ -0,0 +1,222 @@
+import csv
+import re
+import sys
+from collections import namedtuple
+from itertools import islice
+
+from models import PLAYER_FIELDS, Player, intern_player
+
+
+# Rows handed to the storage at a time.
+CHUNK_SIZE = 10000
+
+# Rejected rows kept in the report; the rest are only counted.
+MAX_REJECTED = 1000
+
+# Header spellings found in federation exports, after lower-casing and
+# turning spaces and dashes into underscores.
+FIELD_ALIASES = {
+    'last_name': ('last_name', 'lastname', 'surname', 'family_name'),
+    'first_name': ('first_name', 'firstname', 'given_name', 'forename'),
+    'birth_date': ('birth_date', 'birthdate', 'birthday', 'born', 'b_day'),
+    'chess_id': ('chess_id', 'id', 'id_number', 'fide_id', 'national_id'),
+    'name': ('name', 'full_name'),
+}
+HEADER_FIELDS = {alias: field for field, aliases in FIELD_ALIASES.items()
+                 for alias in aliases}
+
+BIRTH_DATE = re.compile(r'\d{4}(-\d{2}-\d{2})?$')
+# Federation lists put 0000 or nothing for an unknown birth year.
+UNKNOWN_BIRTH_DATES = ('', '0000', '0000-00-00')
+
+# Largest range of chess IDs one registration entry may expand to.
+MAX_RANGE = 10000
+ID_RANGE = re.compile(r'(\D*)(\d+)-(\D*)(\d+)$')
+
+# Score notations accepted in result files besides the 1/2/3 codes.
+RESULT_NOTATIONS = {
+    '1-0': '1', '1/2-1/2': '2', '\u00bd-\u00bd': '2', '0.5-0.5': '2',
+    '=': '2', '0-1': '3',
+}
+
+ImportReport = namedtuple(
+    'ImportReport',
+    'read added updated unchanged duplicates rejected rejected_rows'
+)
+
+
+def header_field(title):
+    return HEADER_FIELDS.get(title.strip().lower().replace(' ', '_')
+                             .replace('-', '_'))
+
+
+def read_csv(f, first_line):
+    # Yields (line number, {field: value}) for every data row.
+    try:
+        dialect = csv.Sniffer().sniff(first_line, delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(f, dialect)
+    fields = [header_field(title)
+              for title in next(csv.reader([first_line], dialect))]
+    for line_number, row in enumerate(reader, start=2):
+        yield line_number, {field: value
+                            for field, value in zip(fields, row) if field}
+
+
+def read_fixed_width(f, first_line):
+    # FIDE style rating list: every column starts under its title, e.g.
+    # "ID Number      Name          Fed Sex ... B-day Flag".
+    starts = [match.start() for match in
+              re.finditer(r'ID Number|\S+', first_line)]
+    columns = []
+    for start, end in zip(starts, starts[1:] + [None]):
+        field = header_field(first_line[start:end])
+        if field:
+            columns.append((field, start, end))
+    for line_number, line in enumerate(f, start=2):
+        yield line_number, {field: line[start:end]
+                            for field, start, end in columns}
+
+
+def parse_player(record):
+    # Returns (Player, None) or (None, reason).
+    record = {field: value.strip() for field, value in record.items()}
+    name = record.pop('name', '')
+    if name and not record.get('last_name'):
+        last_name, _, first_name = name.partition(',')
+        record['last_name'] = last_name.strip()
+        record['first_name'] = first_name.strip()
+
+    for field in PLAYER_FIELDS:
+        if field != 'birth_date' and not record.get(field):
+            return None, f"missing {field.replace('_', ' ')}"
+    birth_date = record.get('birth_date', '')
+    if birth_date in UNKNOWN_BIRTH_DATES:
+        record['birth_date'] = ''
+    elif not BIRTH_DATE.match(birth_date):
+        return None, f"invalid birth date {birth_date!r}"
+    return Player(**intern_player({field: record.get(field, '')
+                                   for field in PLAYER_FIELDS})), None
+
+
+def expand_range(entry):
+    # "AB00010-AB00020" -> AB00010, AB00011, ..., AB00020.
+    match = ID_RANGE.match(entry)
+    if match is None:
+        return [entry]
+    prefix, first, end_prefix, last = match.groups()
+    if end_prefix and end_prefix != prefix:
+        raise ValueError(f"Range {entry} mixes prefixes.")
+    start, stop = int(first), int(last)
+    if stop < start or stop - start >= MAX_RANGE:
+        raise ValueError(f"Invalid range {entry}.")
+    width = len(first)
+    return [f'{prefix}{number:0{width}d}'
+            for number in range(start, stop + 1)]
+
+
+def parse_chess_ids(text):
+    # Chess IDs separated by commas or whitespace, ranges such as
+    # AB00010-AB00020, and @path for a file holding more of the same.
+    chess_ids = []
+    text = re.sub(r'\s*-\s*', '-', text)
+    for entry in re.split(r'[,\s]+', text):
+        if not entry:
+            continue
+        if entry.startswith('@'):
+            with open(entry[1:], 'r') as f:
+                for line in f:
+                    chess_ids.extend(parse_chess_ids(line))
+        else:
+            chess_ids.extend(expand_range(entry))
+    return chess_ids
+
+
+def parse_results(lines):
+    # Reads "board result" lines, e.g. "12 1" or "12,1/2-1/2"; blank lines
+    # and # comments are skipped. Returns [(board, result code)] or raises
+    # ValueError listing every line that could not be read.
+    results = []
+    errors = []
+    for line_number, line in enumerate(lines, start=1):
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        fields = re.split(r'[\s,;]+', line)
+        if len(fields) != 2 or not fields[0].isdigit():
+            errors.append(f"Line {line_number}: expected a board number "
+                          f"and a result, got {line!r}.")
+            continue
+        board, result = fields
+        results.append((int(board), RESULT_NOTATIONS.get(result, result)))
+    if errors:
+        raise ValueError('\n'.join(errors))
+    return results
+
+
+class PlayerImport:
+    # Streams a player list into a storage chunk by chunk, counting what
+    # it reads, rejects and sees twice.
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.read = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.rejected_rows = []
+        self.seen = set()
+
+    def players(self, rows):
+        for line_number, record in rows:
+            self.read += 1
+            player, reason = parse_player(record)
+            if player is None:
+                self.rejected += 1
+                if len(self.rejected_rows) < MAX_REJECTED:
+                    self.rejected_rows.append((line_number, reason))
+                continue
+            if player.chess_id in self.seen:
+                # The later row of the list wins.
+                self.duplicates += 1
+            self.seen.add(player.chess_id)
+            yield player
+
+    def chunks(self, rows):
+        players = self.players(rows)
+        while True:
+            chunk = list(islice(players, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def run(self, storage, f):
+        first_line = f.readline()
+        if 'ID Number' in first_line:
+            rows = read_fixed_width(f, first_line)
+        else:
+            rows = read_csv(f, first_line)
+        added, updated = storage.import_players(self.chunks(rows))
+        return ImportReport(
+            self.read, added, updated,
+            self.read - self.rejected - added - updated,
+            self.duplicates, self.rejected, self.rejected_rows
+        )
+
+
+def import_players(storage, path, chunk_size=CHUNK_SIZE, encoding='utf-8'):
+    with open(path, 'r', encoding=encoding, errors='replace',
+              newline='') as f:
+        return PlayerImport(chunk_size).run(storage, f)
+
+
+if __name__ == '__main__':
+    from storage import open_storage
+
+    storage = open_storage(sys.argv[2] if len(sys.argv) > 2 else None)
+    report = import_players(storage, sys.argv[1])
+    print(f"{report.read} rows read: {report.added} added, "
+          f"{report.updated} updated, {report.unchanged} unchanged, "
+          f"{report.duplicates} duplicates, {report.rejected} rejected.")
+    for line_number, reason in report.rejected_rows:
+        print(f"Line {line_number}: {reason}")
+    storage.close()
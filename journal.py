@@ -0,0 +1,105 @@
+import json
+import os
+
+
+fsync = getattr(os, 'fdatasync', os.fsync)
+
+
+class Journal:
+    def __init__(self, path='tournaments.journal'):
+        self.path = path
+        self.count = 0
+        # Bytes of the file already replayed or written by this process.
+        self.offset = 0
+        # Records are stamped with the generation of the snapshot they
+        # were written on top of; replay skips those of older ones.
+        self.generation = 0
+        self._file = None
+
+    def __len__(self):
+        return self.count
+
+    def append(self, record):
+        self.extend([record])
+
+    def extend(self, records):
+        # One write and one fsync for the whole batch.
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        generation = self.generation
+        self._file.write(''.join(
+            json.dumps(dict(record, generation=generation),
+                       separators=(',', ':')) + '\n'
+            for record in records
+        ))
+        self._file.flush()
+        fsync(self._file.fileno())
+        self.count += len(records)
+        self.offset = self._file.tell()
+
+    def replay(self, offset=0):
+        # Yields the records from offset on; replay(self.offset) only
+        # yields what other processes appended since.
+        if offset == 0:
+            self.count = 0
+        self.offset = offset
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-write: drop it so
+                    # the next append starts on a clean line.
+                    self.truncate(self.offset)
+                    return
+                self.offset += len(line)
+                self.count += 1
+                if record.get('generation', 0) >= self.generation:
+                    yield record
+
+    def truncate(self, offset):
+        self.close()
+        with open(self.path, 'r+b') as f:
+            f.truncate(offset)
+
+    def clear(self, generation=None):
+        if generation is not None:
+            self.generation = generation
+        self.close()
+        with open(self.path, 'w'):
+            pass
+        self.count = 0
+        self.offset = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RecordBatch:
+    # Stands in for a tournament's journal and hands the records on to it
+    # in batches: one fsync, shard write or transaction per flush instead
+    # of one per result.
+    def __init__(self, sink):
+        self.sink = sink
+        self.records = []
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, record):
+        self.records.append(record)
+
+    def flush(self):
+        if not self.records:
+            return
+        records, self.records = self.records, []
+        if hasattr(self.sink, 'extend'):
+            self.sink.extend(records)
+        else:
+            for record in records:
+                self.sink.append(record)
@@ -0,0 +1,92 @@
+import json
+import os
+import stat
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def file_mode(path):
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+@contextmanager
+def atomic_write(path):
+    # Yields a temporary file next to path and swaps it in once the block
+    # is done, so readers see either the old file or the new one, never
+    # half of it.
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(
+        dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp'
+    )
+    try:
+        # mkstemp makes the file owner-only; keep the permissions of the
+        # file being replaced, or what open() would have given a new one,
+        # so other accounts sharing the data can still read it.
+        os.chmod(temp_path, file_mode(path))
+        with os.fdopen(fd, 'w') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def atomic_dump(data, path):
+    with atomic_write(path) as f:
+        json.dump(data, f, indent=4)
+
+
+class DataLock:
+    # An flock on <path>.lock guarding a data file shared by several
+    # processes. The lock file also holds a small JSON state whose version
+    # counter every writer bumps, so a process can tell that its copy of
+    # the data has gone stale.
+    def __init__(self, path):
+        self.path = path + '.lock'
+
+    @contextmanager
+    def hold(self):
+        with open(self.path, 'a+') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield self
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def read(self):
+        with open(self.path, 'r') as f:
+            content = f.read()
+        state = json.loads(content) if content else {}
+        state.setdefault('version', 0)
+        return state
+
+    def write(self, **changes):
+        # Only call while holding the lock. The file is rewritten in place:
+        # replacing it would leave the other processes locking a different
+        # inode.
+        state = self.read()
+        state.update(changes)
+        with open(self.path, 'r+') as f:
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        return state
+
+    def bump(self, **changes):
+        return self.write(version=self.read()['version'] + 1, **changes)
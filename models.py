@@ -1,33 +1,381 @@
 import json
 import os
+import sys
+from bisect import bisect_left, bisect_right, insort
 from collections import defaultdict
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
-from random import shuffle
+from functools import lru_cache
+from itertools import islice
+from threading import Condition, Lock, Thread
+from uuid import NAMESPACE_URL, uuid4, uuid5
+
+from journal import RecordBatch
+from locking import atomic_dump, atomic_write
+from pairing import (PairingError, new_seed, random_pairings,
+                     swiss_pairings)
+from tiebreaks import TIEBREAKS, compute_tiebreaks
+
+
+# Points for (player 1, player 2) for each result code typed in play_round.
+RESULT_POINTS = {'1': (1, 0), '2': (0.5, 0.5), '3': (0, 1)}
+POINTS_RESULT = {points: result for result, points in RESULT_POINTS.items()}
+PLAYER_FIELDS = ('last_name', 'first_name', 'birth_date', 'chess_id')
+PAIRING_SYSTEMS = ('swiss', 'round_robin', 'double_round_robin')
+# Players a tournament needs before its first round is paired, by
+# pairing system: a Swiss needs a field, a round-robin is a closed
+# section or league of any size.
+MIN_PLAYERS = {'swiss': 16, 'round_robin': 2, 'double_round_robin': 2}
+
+
+class WriteConflict(ValueError):
+    # Another process changed the tournament in a way that makes this
+    # change stale, e.g. it paired the same round first.
+    def __init__(self, message, records=()):
+        super().__init__(message)
+        # The records dropped, when found stale as they were written.
+        self.records = list(records)
+
+
+def intern_player(player):
+    for field in PLAYER_FIELDS:
+        value = player.get(field)
+        if type(value) is str:
+            player[field] = sys.intern(value)
+    return player
 
 
 class Player:
+    __slots__ = PLAYER_FIELDS
+
     def __init__(self, last_name, first_name, birth_date, chess_id):
         self.last_name = last_name
         self.first_name = first_name
         self.birth_date = birth_date
         self.chess_id = chess_id
 
+    def to_dict(self):
+        return {
+            'last_name': self.last_name,
+            'first_name': self.first_name,
+            'birth_date': self.birth_date,
+            'chess_id': self.chess_id,
+        }
+
     @staticmethod
     def load_players():
         if os.path.exists('players.json'):
             with open('players.json', 'r') as f:
-                return [Player(**player) for player in json.load(f)]
+                return [Player(**intern_player(player))
+                        for player in json.load(f)]
         else:
             return []
 
     @staticmethod
     def save_players(players):
-        with open('players.json', 'w') as f:
-            json.dump([player.__dict__ for player in players], f, indent=4)
+        # Same layout as json.dump(..., indent=4), written one player at a
+        # time: the indenting encoder is pure Python and far too slow for
+        # a federation sized list.
+        dumps = json.dumps
+        with atomic_write('players.json') as f:
+            separator = '[\n    {\n'
+            for player in players:
+                f.write(separator)
+                f.write(',\n'.join(
+                    f'        "{field}": {dumps(getattr(player, field))}'
+                    for field in PLAYER_FIELDS
+                ))
+                separator = '\n    },\n    {\n'
+            f.write('[]' if separator == '[\n    {\n' else '\n    }\n]')
+
+
+class TournamentEntry:
+    __slots__ = PLAYER_FIELDS + ('score',)
+
+    def __init__(self, last_name, first_name, birth_date, chess_id,
+                 score=0):
+        self.last_name = last_name
+        self.first_name = first_name
+        self.birth_date = birth_date
+        self.chess_id = chess_id
+        self.score = score
+
+    def to_dict(self):
+        return {
+            'last_name': self.last_name,
+            'first_name': self.first_name,
+            'birth_date': self.birth_date,
+            'chess_id': self.chess_id,
+            'score': self.score,
+        }
+
+    @staticmethod
+    def from_dict(data):
+        data = intern_player(data)
+        return TournamentEntry(data['last_name'], data['first_name'],
+                               data['birth_date'], data['chess_id'],
+                               data.get('score', 0))
+
+    @staticmethod
+    def from_player(player):
+        return TournamentEntry(player.last_name, player.first_name,
+                               player.birth_date, player.chess_id)
+
+
+class Match:
+    __slots__ = ('player1', 'player2', 'score1', 'score2')
+
+    def __init__(self, player1, player2=None, score1=0, score2=0):
+        self.player1 = player1
+        self.player2 = player2
+        self.score1 = score1
+        self.score2 = score2
+
+    @property
+    def is_bye(self):
+        return self.player2 is None
+
+    @property
+    def result(self):
+        return POINTS_RESULT.get((self.score1, self.score2))
+
+    def apply_result(self, result):
+        points = RESULT_POINTS.get(result)
+        if points is None:
+            return False
+
+        self.player1.score += points[0] - self.score1
+        self.score1 = points[0]
+        if self.player2 is not None:
+            self.player2.score += points[1] - self.score2
+        # A bye keeps score2 too: (0.5, 0.5) is a half point bye and
+        # (0, 1) a zero point one.
+        self.score2 = points[1]
+        return True
+
+    def to_list(self):
+        player2 = self.player2
+        return [self.player1.chess_id,
+                player2.chess_id if player2 is not None else None,
+                POINTS_RESULT.get((self.score1, self.score2))]
+
+    @staticmethod
+    def from_list(data, identity_map):
+        chess_id1, chess_id2, result = data
+        score1, score2 = RESULT_POINTS.get(result, (0, 0))
+        if chess_id2 is None:
+            return Match(identity_map[chess_id1], None, score1, score2)
+        return Match(identity_map[chess_id1], identity_map[chess_id2],
+                     score1, score2)
+
+
+class Round:
+    __slots__ = ('name', 'start_datetime', 'end_datetime', 'matches',
+                 'seed')
+
+    def __init__(self, name, start_datetime=None, end_datetime=None,
+                 matches=None, seed=None):
+        self.name = name
+        self.start_datetime = start_datetime
+        self.end_datetime = end_datetime
+        self.matches = matches if matches is not None else []
+        self.seed = seed
+
+    def to_dict(self):
+        data = {'name': self.name, 'start_datetime': self.start_datetime}
+        if self.end_datetime is not None:
+            data['end_datetime'] = self.end_datetime
+        if self.seed is not None:
+            data['seed'] = self.seed
+        data['pairings'] = [match.to_list() for match in self.matches]
+        return data
+
+    @staticmethod
+    def from_dict(data, identity_map):
+        return Round(data['name'], data.get('start_datetime'),
+                     data.get('end_datetime'),
+                     [Match.from_list(pairing, identity_map)
+                      for pairing in data['pairings']],
+                     data.get('seed'))
+
+
+class PairingHistory:
+    __slots__ = ('pairs', 'byes', 'colors')
+
+    def __init__(self, rounds=()):
+        self.pairs = set()
+        self.byes = set()
+        # Whites minus blacks; player1 of a match has white.
+        self.colors = defaultdict(int)
+        for round_data in rounds:
+            self.add_round(round_data)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def add_round(self, round_data):
+        for match in round_data.matches:
+            if match.is_bye:
+                self.byes.add(match.player1.chess_id)
+            else:
+                self.pairs.add(frozenset((match.player1.chess_id,
+                                          match.player2.chess_id)))
+                self.colors[match.player1.chess_id] += 1
+                self.colors[match.player2.chess_id] -= 1
+
+    def have_met(self, chess_id1, chess_id2):
+        return frozenset((chess_id1, chess_id2)) in self.pairs
+
+    def had_bye(self, chess_id):
+        return chess_id in self.byes
+
+
+@lru_cache(maxsize=None)
+def berger_table(n):
+    # FIDE Berger table for an even number of players n, as a tuple of
+    # rounds of (white, black) positions counted from 0. Player n - 1 sits
+    # on board 1 and takes white every other round; the others pair off
+    # around the pivot of the round.
+    last = n - 1
+    table = []
+    for round_num in range(last):
+        pivot = round_num * (n // 2) % last
+        if round_num % 2 == 0:
+            pairs = [(pivot, last)]
+        else:
+            pairs = [(last, pivot)]
+        pairs.extend(((pivot + k) % last, (pivot - k) % last)
+                     for k in range(1, n // 2))
+        table.append(tuple(pairs))
+    return tuple(table)
+
+
+class RoundRobinScheduler:
+    # Every round of a (double) round-robin between players, in their
+    # order, as tuples of (white chess_id, black chess_id); black is None
+    # for the bye when the number of players is odd. The second cycle of
+    # a double round-robin repeats the first with colors reversed.
+    __slots__ = ('rounds', 'double')
+
+    def __init__(self, players, double=False):
+        self.double = double
+        chess_ids = [player.chess_id for player in players]
+        if len(chess_ids) % 2:
+            chess_ids.append(None)
+
+        rounds = []
+        for table_round in berger_table(len(chess_ids)):
+            pairings = []
+            bye = None
+            for white, black in table_round:
+                white, black = chess_ids[white], chess_ids[black]
+                if white is None or black is None:
+                    bye = (black if white is None else white, None)
+                else:
+                    pairings.append((white, black))
+            if bye is not None:
+                pairings.append(bye)
+            rounds.append(tuple(pairings))
+        if double:
+            rounds.extend(tuple((black, white) if black is not None
+                                else (white, None)
+                                for white, black in pairings)
+                          for pairings in list(rounds))
+        self.rounds = tuple(rounds)
+
+    def __len__(self):
+        return len(self.rounds)
+
+    def pairings(self, round_num):
+        return self.rounds[round_num]
+
+
+class Standings:
+    # Players grouped by score, each group kept sorted by tie-break key,
+    # so a result moves one player between two groups instead of
+    # re-sorting the whole field.
+    def __init__(self, players, tiebreak=None):
+        self.tiebreak = tiebreak
+        self.order = {player.chess_id: i for i, player in enumerate(players)}
+        self.players = {}
+        self.keys = {}
+        self.groups = {}
+        self.scores = []
+        for player in players:
+            self.add(player)
+
+    def __len__(self):
+        return len(self.players)
+
+    def key(self, player):
+        order = self.order.setdefault(player.chess_id, len(self.order))
+        if self.tiebreak is None:
+            return (order, player.chess_id)
+        return tuple(-value for value in self.tiebreak(player)) + \
+            (order, player.chess_id)
+
+    def add(self, player):
+        key = self.key(player)
+        score = player.score
+        group = self.groups.get(score)
+        if group is None:
+            group = self.groups[score] = []
+            insort(self.scores, score)
+        insort(group, key)
+        self.players[player.chess_id] = player
+        self.keys[player.chess_id] = (score, key)
+
+    def remove(self, chess_id):
+        score, key = self.keys.pop(chess_id)
+        del self.players[chess_id]
+        group = self.groups[score]
+        del group[bisect_left(group, key)]
+        if not group:
+            del self.groups[score]
+            del self.scores[bisect_left(self.scores, score)]
+
+    def update(self, player):
+        if self.keys.get(player.chess_id) != (player.score,
+                                              self.key(player)):
+            if player.chess_id in self.keys:
+                self.remove(player.chess_id)
+            self.add(player)
+
+    def __iter__(self):
+        for score in reversed(self.scores):
+            for key in self.groups[score]:
+                yield self.players[key[-1]]
+
+    def top(self, n):
+        return list(islice(self, n))
+
+    def leader(self):
+        return next(iter(self), None)
+
+    def rank(self, chess_id):
+        score, key = self.keys[chess_id]
+        above = sum(len(self.groups[higher]) for higher in
+                    self.scores[bisect_right(self.scores, score):])
+        return above + bisect_left(self.groups[score], key) + 1
+
+    def score_groups(self):
+        return [(score, [self.players[key[-1]]
+                         for key in self.groups[score]])
+                for score in reversed(self.scores)]
 
 
 class Tournament:
-    def __init__(self, name, location, start_date, end_date, num_rounds, current_round=1, rounds=None, players=None):
+    __slots__ = ('tournament_id', 'name', 'location', 'start_date',
+                 'end_date', 'num_rounds', 'current_round', 'rounds',
+                 'players', 'pairing_system', 'journal', '_history',
+                 '_standings', '_schedule')
+
+    def __init__(self, name, location, start_date, end_date, num_rounds,
+                 current_round=1, rounds=None, players=None,
+                 tournament_id=None, pairing_system='swiss'):
+        if pairing_system not in PAIRING_SYSTEMS:
+            raise ValueError(f"Unknown pairing system {pairing_system!r}.")
+        self.tournament_id = tournament_id or uuid4().hex
         self.name = name
         self.location = location
         self.start_date = start_date
@@ -35,91 +383,580 @@ class Tournament:
         self.num_rounds = num_rounds
         self.current_round = current_round
         self.rounds = rounds if rounds is not None else []
-        self.players = []
+        self.players = players if players is not None else []
+        self.pairing_system = pairing_system
+        self.journal = None
+        self._history = None
+        self._standings = None
+        self._schedule = None
 
+    @property
+    def history(self):
+        if self._history is None:
+            self._history = PairingHistory(self.rounds)
+        return self._history
+
+    @property
+    def min_players(self):
+        return MIN_PLAYERS[self.pairing_system]
+
+    @property
+    def standings(self):
+        # Built with the tie-breaks on first use, then kept up to date by
+        # every result; end_round refreshes the tie-breaks.
+        if self._standings is None:
+            self.rank_by_tiebreaks()
+        return self._standings
+
+    def to_dict(self):
+        return {
+            'tournament_id': self.tournament_id,
+            'name': self.name,
+            'location': self.location,
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'num_rounds': self.num_rounds,
+            'current_round': self.current_round,
+            'pairing_system': self.pairing_system,
+            'players': [player.to_dict() for player in self.players],
+            'rounds': [round_data.to_dict() for round_data in self.rounds],
+        }
 
     @staticmethod
-    def load_tournaments():
+    def from_dict(data):
+        data = dict(data)
+        rounds = data.pop('rounds', [])
+        data['players'] = [TournamentEntry.from_dict(player)
+                           for player in data.get('players', [])]
+        tournament = Tournament(**data)
+        identity_map = tournament.identity_map()
+        tournament.rounds = [None] * len(rounds)
+        # Latest round first, so a player missing from an old file's
+        # player list is recovered with their most recent score.
+        for i in reversed(range(len(rounds))):
+            tournament.rounds[i] = tournament.round_from_dict(rounds[i],
+                                                              identity_map)
+        return tournament
+
+    def identity_map(self):
+        identity_map = {}
+        for player in self.players:
+            identity_map.setdefault(player.chess_id, player)
+        if len(identity_map) != len(self.players):
+            self.players = list(identity_map.values())
+        return identity_map
+
+    def resolve_player(self, player, identity_map):
+        canonical = identity_map.get(player['chess_id'])
+        if canonical is None:
+            canonical = TournamentEntry.from_dict(player)
+            identity_map[canonical.chess_id] = canonical
+            self.players.append(canonical)
+        return canonical
+
+    def recover_player(self, chess_id, identity_map):
+        # A pairing names a player missing from the player list, e.g.
+        # after a re-registration in an older version: bring them back
+        # under their chess ID rather than fail to load.
+        return self.resolve_player({'last_name': '', 'first_name': '',
+                                    'birth_date': '', 'chess_id': chess_id},
+                                   identity_map)
+
+    def round_from_dict(self, data, identity_map=None):
+        if identity_map is None:
+            identity_map = self.identity_map()
+
+        if 'pairings' in data:
+            for pairing in data['pairings']:
+                for chess_id in pairing[:2]:
+                    if chess_id is not None and chess_id not in identity_map:
+                        self.recover_player(chess_id, identity_map)
+            return Round.from_dict(data, identity_map)
+
+        # Rounds saved before pairings were normalized embed a copy of
+        # the player dict in each match.
+        matches = []
+        for entries in data['matches']:
+            match = Match(self.resolve_player(entries[0][0], identity_map),
+                          score1=entries[0][1])
+            if len(entries) > 1:
+                match.player2 = self.resolve_player(entries[1][0],
+                                                    identity_map)
+                match.score2 = entries[1][1]
+            matches.append(match)
+        return Round(data['name'], data.get('start_datetime'),
+                     data.get('end_datetime'), matches)
+
+    @staticmethod
+    def legacy_tournament_id(index, data):
+        # Tournaments saved before they had an id get one derived from
+        # their place in the file, the same on every load, so journal
+        # records written before the next compaction still find them.
+        return uuid5(NAMESPACE_URL, f"tournaments.json#{index}/"
+                     f"{data.get('name')}/{data.get('start_date')}").hex
+
+    @staticmethod
+    def load_tournaments(journal=None):
+        # The snapshot is {"generation": n, "tournaments": [...]}, or a
+        # plain list in files written before journal generations.
+        tournaments = []
+        generation = 0
         if os.path.exists('tournaments.json'):
             with open('tournaments.json', 'r') as f:
-                tournament_objects = []
-                for tournament in json.load(f):
-                    tournament_objects.append(Tournament(**tournament))
-                return tournament_objects
-        else:
-            return []
+                snapshot = json.load(f)
+            if isinstance(snapshot, dict):
+                generation = snapshot['generation']
+                snapshot = snapshot['tournaments']
+            for index, data in enumerate(snapshot):
+                if not data.get('tournament_id'):
+                    data['tournament_id'] = \
+                        Tournament.legacy_tournament_id(index, data)
+                tournaments.append(Tournament.from_dict(data))
+
+        if journal is not None:
+            # Records of an older generation are already in the snapshot.
+            journal.generation = generation
+            Tournament.replay_records(tournaments, journal.replay())
+            for tournament in tournaments:
+                tournament.journal = journal
+
+        return tournaments
 
     @staticmethod
-    def save_tournaments(tournaments):
-        with open('tournaments.json', 'w') as f:
-            data = [tournament.__dict__ for tournament in tournaments]
-            json.dump(data, f, indent=4)
+    def replay_records(tournaments, records, rejected=None):
+        # Applies journal records to the tournaments list in place and
+        # returns the tournaments the records created. Records that
+        # conflict with those before them are skipped, and appended to
+        # rejected when given.
+        by_id = {t.tournament_id: t for t in tournaments}
+        created = []
+        for record in records:
+            if record['op'] == 'create':
+                if record['tournament'] in by_id:
+                    continue
+                tournament = Tournament.from_dict(record['data'])
+                tournaments.append(tournament)
+                created.append(tournament)
+                by_id[tournament.tournament_id] = tournament
+            elif record['tournament'] in by_id:
+                if not by_id[record['tournament']].apply_record(record) \
+                        and rejected is not None:
+                    rejected.append(record)
+        return created
 
-    def generate_matches(self, avoid_duplicates=True):
-        matches = []
-        remaining_players = self.players.copy()
-        shuffle(remaining_players)
-
-        while remaining_players:
-            player1 = remaining_players.pop(0)
-            if remaining_players:
-                player2 = remaining_players.pop(0)
-                if avoid_duplicates and any(
-                    player1 in match and player2 in match for match in matches
-                ):
-                    remaining_players.append(player1)
-                    remaining_players.append(player2)
-                else:
-                    matches.append([[player1, 0], [player2, 0]])
-            else:
-                matches.append([[player1, 0]])
+    @staticmethod
+    def save_tournaments(tournaments, journal=None):
+        # The snapshot moves on to the journal's next generation in the
+        # same atomic write: if clearing the journal afterwards does not
+        # happen, its records are still known to be in the snapshot.
+        generation = journal.generation + 1 if journal is not None else 0
+        atomic_dump({'generation': generation,
+                     'tournaments': [tournament.to_dict()
+                                     for tournament in tournaments]},
+                    'tournaments.json')
+        if journal is not None:
+            journal.clear(generation)
+
+    def record(self, op, **fields):
+        if self.journal is not None:
+            self.journal.append(
+                dict(op=op, tournament=self.tournament_id, **fields)
+            )
+
+    def apply_record(self, record):
+        # Returns False, changing nothing, for a record that does not fit
+        # the tournament: a round paired for a position already taken, or
+        # a result for a game that is not on that board.
+        op = record['op']
+        if op == 'update':
+            for field, value in record['fields'].items():
+                setattr(self, field, value)
+        elif op == 'register':
+            self.players = [TournamentEntry.from_dict(player)
+                            for player in record['players']]
+            self.identity_map()
+            self._standings = None
+            self._schedule = None
+        elif op == 'round':
+            # Records written before rounds were numbered have no round_num.
+            if record.get('round_num', len(self.rounds)) != len(self.rounds):
+                return False
+            self.append_round(self.round_from_dict(record['round']))
+        elif op == 'result':
+            round_num, match_index = record['round'], record['match']
+            if round_num >= len(self.rounds) or \
+                    match_index >= len(self.rounds[round_num].matches):
+                return False
+            match = self.rounds[round_num].matches[match_index]
+            if 'pairing' in record and \
+                    match.to_list()[:2] != record['pairing']:
+                return False
+            self.apply_result(round_num, match_index, record['result'])
+        elif op == 'end_round':
+            if record['round'] >= len(self.rounds):
+                return False
+            self.rounds[record['round']].end_datetime = \
+                record['end_datetime']
+        return True
+
+    @contextmanager
+    def writing(self):
+        # Wraps a change: a storage shared between processes is locked
+        # and the tournament caught up on what the others wrote, so the
+        # change is checked against and made on top of it.
+        hold = getattr(self.journal, 'hold', None)
+        with hold() if hold is not None else nullcontext():
+            yield
+
+    def update(self, **fields):
+        with self.writing():
+            for field, value in fields.items():
+                setattr(self, field, value)
+            self.record('update', fields=fields)
+
+    def tiebreaks(self):
+        # {chess_id: (buchholz, median buchholz, sonneborn-berger,
+        # cumulative)} over every result entered so far.
+        values = compute_tiebreaks(self.players, self.rounds)
+        columns = [values[name] for name in TIEBREAKS]
+        return {player.chess_id: tuple(column[i] for column in columns)
+                for i, player in enumerate(self.players)}
+
+    def rank_by_tiebreaks(self, tiebreaks=None):
+        # Tie-breaks depend on the opponents' results too, so they are
+        # refreshed once per round rather than on every result.
+        if tiebreaks is None:
+            tiebreaks = self.tiebreaks()
+        self._standings = Standings(
+            self.players, tiebreak=lambda player: tiebreaks.get(
+                player.chess_id, (0,) * len(TIEBREAKS))
+        )
+        return self._standings
+
+    def register(self, players):
+        with self.writing():
+            if self.rounds:
+                raise ValueError(f"{self.name} has already started.")
+            self.players = players
+            self._standings = None
+            self._schedule = None
+            self.record('register',
+                        players=[player.to_dict() for player in players])
+            if self.pairing_system != 'swiss':
+                # A round-robin lasts exactly as many rounds as its
+                # schedule.
+                self.update(num_rounds=len(self.round_robin_schedule()))
+
+    def append_round(self, round_data):
+        self.rounds.append(round_data)
+        if self._history is not None:
+            self._history.add_round(round_data)
+
+    def add_round(self, round_data):
+        # round_data was paired from the rounds known until now: if
+        # another process added one meanwhile, it is stale.
+        round_num = len(self.rounds)
+        players = self.players
+        with self.writing():
+            if len(self.rounds) != round_num:
+                raise WriteConflict(f"Round {round_num + 1} of {self.name} "
+                                    "was already paired elsewhere.")
+            if self.players is not players:
+                # Reloaded: point the matches at the current entries.
+                self.rebind(round_data)
+            self.append_round(round_data)
+            self.record('round', round=round_data.to_dict(),
+                        round_num=round_num)
+            # A bye is a win, scored here for whichever pairer made the
+            # round.
+            for index, match in enumerate(round_data.matches):
+                if match.is_bye:
+                    self.record_result(round_num, index, '1')
+
+    def rebind(self, round_data):
+        identity_map = {player.chess_id: player for player in self.players}
+        for match in round_data.matches:
+            for slot in ('player1', 'player2'):
+                player = getattr(match, slot)
+                if player is None:
+                    continue
+                if player.chess_id not in identity_map:
+                    raise WriteConflict(f"{player.chess_id} is no longer "
+                                        f"registered in {self.name}.")
+                setattr(match, slot, identity_map[player.chess_id])
 
+    def record_result(self, round_num, match_index, result):
+        # Applies and journals one result. Returns False for an invalid
+        # result code.
+        with self.writing():
+            if not self.apply_result(round_num, match_index, result):
+                return False
+            match = self.rounds[round_num].matches[match_index]
+            self.record('result', round=round_num, match=match_index,
+                        result=result, pairing=match.to_list()[:2])
+            return True
+
+    def apply_result(self, round_num, match_index, result):
+        match = self.rounds[round_num].matches[match_index]
+        if not match.apply_result(result):
+            return False
+
+        if self._standings is not None:
+            self._standings.update(match.player1)
+            if match.player2 is not None:
+                self._standings.update(match.player2)
+        return True
+
+    def generate_matches(self, avoid_duplicates=True, seed=None,
+                         history=None):
+        players = self.players
+        have_met = None
+        if avoid_duplicates:
+            history = history if history is not None else self.history
+            chess_ids = [player.chess_id for player in players]
+
+            def have_met(i, j):
+                return history.have_met(chess_ids[i], chess_ids[j])
+
+        pairs, bye = random_pairings(len(players), have_met, seed)
+
+        matches = [Match(players[i], players[j]) for i, j in pairs]
+        if bye is not None:
+            matches.append(Match(players[bye]))
         return matches
 
-    def generate_swiss_system_matches(self):
-        players_by_score = sorted(
-            self.players, key=lambda x: x['score'], reverse=True
+    def random_round(self, name, seed=None):
+        if seed is None:
+            seed = new_seed()
+        return Round(name, datetime.now().isoformat(),
+                     matches=self.generate_matches(seed=seed), seed=seed)
+
+    def replay_pairing(self, round_num):
+        round_data = self.rounds[round_num]
+        if round_data.seed is None:
+            return None
+        return self.generate_matches(
+            seed=round_data.seed,
+            history=PairingHistory(self.rounds[:round_num])
         )
-        matches = []
-        score_groups = defaultdict(list)
-
-        for player in players_by_score:
-            score_groups[player['score']].append(player)
-
-        for score, group in sorted(score_groups.items(), reverse=True):
-            group_len = len(group)
-            if group_len % 2 == 1:
-                matches.append([[group.pop(), 0]])
-            shuffle(group)
-            for i in range(0, group_len, 2):
-                player1 = group[i]
-                if i + 1 < group_len:
-                    player2 = group[i + 1]
-                    matches.append([[player1, 0], [player2, 0]])
 
+    def round_robin_schedule(self, double=None):
+        # Built once from the registration order; registering players
+        # again starts a new schedule. double defaults to the pairing
+        # system's.
+        if double is None:
+            double = self.pairing_system == 'double_round_robin'
+        if self._schedule is None or self._schedule.double != double:
+            self._schedule = RoundRobinScheduler(self.players, double)
+        return self._schedule
+
+    def generate_round_robin_matches(self, double=None):
+        schedule = self.round_robin_schedule(double)
+        if len(self.rounds) >= len(schedule):
+            raise PairingError(f"The round-robin schedule of {self.name} "
+                               f"has only {len(schedule)} rounds.")
+        identity_map = {player.chess_id: player for player in self.players}
+        return [Match(identity_map[white], identity_map.get(black))
+                for white, black in schedule.pairings(len(self.rounds))]
+
+    def generate_next_matches(self):
+        # The next round, paired with the tournament's pairing system.
+        if self.pairing_system == 'swiss':
+            return self.generate_swiss_system_matches()
+        return self.generate_round_robin_matches()
+
+    def swiss_arguments(self):
+        # Everything swiss_pairings needs, copied out of the players so
+        # another thread can pair while results keep coming in.
+        # Players are ranked by score then registration order, not by
+        # tie-breaks, so a result only moves the brackets of its players.
+        players = self.players
+        chess_ids = [player.chess_id for player in players]
+        history = self.history
+        return {
+            'scores': [player.score for player in players],
+            'have_met': lambda i, j: history.have_met(chess_ids[i],
+                                                      chess_ids[j]),
+            'colors': [history.colors.get(chess_id, 0)
+                       for chess_id in chess_ids],
+            'had_bye': lambda i: history.had_bye(chess_ids[i]),
+        }
+
+    def swiss_matches(self, pairs, bye):
+        players = self.players
+        matches = [Match(players[white], players[black])
+                   for white, black in pairs]
+        if bye is not None:
+            matches.append(Match(players[bye]))
         return matches
 
-    def play_round(self, round_num):
+    def generate_swiss_system_matches(self):
+        return self.swiss_matches(*swiss_pairings(**self.swiss_arguments()))
+
+    def play_round(self, round_num, speculation=None):
+        # speculation, a SpeculativePairing, is told about every result so
+        # the next round is paired while this one is being entered.
         round_data = self.rounds[round_num]
+        lock = speculation.lock if speculation is not None else nullcontext()
 
-        for i, match in enumerate(round_data['matches'], start=1):
-            player1 = match[0][0]
-            player2 = match[1][0] if len(match) > 1 else None
-            result = input(
-                f"Enter result for match {i} ({player1['first_name']} "
-                f"{player1['last_name']} vs. {player2['first_name']} "
-                f"{player2['last_name']}) "
-                "(1 for win, 2 for draw, 3 for loss): "
-            )
+        for i, match in enumerate(round_data.matches):
+            player1 = match.player1
+            player2 = match.player2
+            if match.is_bye:
+                if match.result is not None:
+                    continue
+                result = '1'
+            else:
+                result = input(
+                    f"Enter result for match {i + 1} ({player1.first_name} "
+                    f"{player1.last_name} vs. {player2.first_name} "
+                    f"{player2.last_name}) "
+                    "(1 for win, 2 for draw, 3 for loss): "
+                )
 
-            if result == '1':
-                match[0][0]['score'] += 1
-            elif result == '2':
-                match[0][0]['score'] += 0.5
-                match[1][0]['score'] += 0.5
-            elif result == '3':
-                match[1][0]['score'] += 1
+            with lock:
+                applied = self.record_result(round_num, i, result)
+            if applied and speculation is not None:
+                speculation.update()
 
-        round_data['end_datetime'] = datetime.now().isoformat()
-        self.save_tournaments([self])
+        self.end_round(round_num)
         print("\n")
+
+    def enter_results(self, round_num, results):
+        # results: (board, result code) pairs for the round, boards counted
+        # from 1. Every entry is checked before any is applied; byes left
+        # out are scored as wins. All records go out in one batch, and the
+        # round ends once every board has a result. Returns the boards
+        # still missing a result.
+        with self.writing():
+            return self._enter_results(round_num, results)
+
+    def _enter_results(self, round_num, results):
+        round_data = self.rounds[round_num]
+        matches = round_data.matches
+        errors = []
+        entered = {}
+        for board, result in results:
+            if not 1 <= board <= len(matches):
+                errors.append(f"Board {board} does not exist.")
+            elif board in entered:
+                errors.append(f"Board {board} has more than one result.")
+            elif result not in RESULT_POINTS:
+                errors.append(f"Invalid result {result!r} on board {board}.")
+            elif matches[board - 1].is_bye and result != '1':
+                errors.append(f"Board {board} is a bye.")
+            else:
+                entered[board] = result
+        if errors:
+            raise ValueError('\n'.join(errors))
+
+        # Byes are scored as the round is added; only rounds from before
+        # that still need it.
+        for board, match in enumerate(matches, start=1):
+            if match.is_bye and match.result is None:
+                entered.setdefault(board, '1')
+
+        with self.batched_journal():
+            for board, result in entered.items():
+                self.record_result(round_num, board - 1, result)
+            missing = [board for board, match in enumerate(matches, start=1)
+                       if match.result is None]
+            if not missing and round_data.end_datetime is None:
+                self.end_round(round_num)
+        return missing
+
+    def end_round(self, round_num):
+        with self.writing():
+            round_data = self.rounds[round_num]
+            round_data.end_datetime = datetime.now().isoformat()
+            self.record('end_round', round=round_num,
+                        end_datetime=round_data.end_datetime)
+        self.rank_by_tiebreaks()
+
+    @contextmanager
+    def batched_journal(self):
+        # Holds back the records written inside the block and hands them
+        # to the journal in one batch at the end.
+        journal = self.journal
+        if journal is None:
+            yield
+            return
+        self.journal = batch = RecordBatch(journal)
+        try:
+            yield
+        finally:
+            self.journal = journal
+            batch.flush()
+
+
+class SpeculativePairing:
+    # Pairs the next round in a background thread while the results of
+    # the current one are entered. Every result restarts the pairing, and
+    # the bracket cache keeps the brackets that result did not touch, so
+    # the pairing is ready as soon as the last result is in.
+    def __init__(self, tournament):
+        self.tournament = tournament
+        self.lock = Lock()
+        self.changed = Condition(self.lock)
+        self.cache = {}
+        self.version = 0
+        self.paired_version = -1
+        self.pairing = None
+        self.error = None
+        self.closed = False
+        # Build the history here: the worker only reads it.
+        tournament.history
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def update(self):
+        with self.changed:
+            self.version += 1
+            self.changed.notify_all()
+
+    def run(self):
+        while True:
+            with self.changed:
+                while self.paired_version == self.version and \
+                        not self.closed:
+                    self.changed.wait()
+                if self.closed:
+                    return
+                version = self.version
+                try:
+                    arguments, error = self.tournament.swiss_arguments(), None
+                except Exception as e:
+                    arguments, error = None, e
+
+            pairing = None
+            if error is None:
+                try:
+                    pairing = swiss_pairings(cache=self.cache, **arguments)
+                except Exception as e:
+                    # Not only PairingError: whatever went wrong, matches()
+                    # has to raise it rather than wait for a pairing that
+                    # never comes.
+                    error = e
+
+            with self.changed:
+                self.pairing, self.error = pairing, error
+                self.paired_version = version
+                self.changed.notify_all()
+
+    def matches(self):
+        # Waits for the pairing of the latest results and stops the
+        # worker. Raises PairingError when no pairing exists.
+        with self.changed:
+            while self.paired_version != self.version:
+                self.changed.wait()
+            self.closed = True
+            self.changed.notify_all()
+        if self.error is not None:
+            raise self.error
+        return self.tournament.swiss_matches(*self.pairing)
+
+    def close(self):
+        # Stops the worker when its pairing is not needed after all.
+        with self.changed:
+            self.closed = True
+            self.changed.notify_all()
@@ -0,0 +1,283 @@
+from random import Random, randrange
+
+from matching import max_weight_matching
+
+
+# Players handed to one blossom run. Larger fields are cut into brackets
+# of about this size, top scores first, and whoever is left unpaired
+# floats down into the next bracket.
+BRACKET_SIZE = 24
+
+# Edge weights, from the most to the least important criterion. Every
+# term must stay below the one above it for the whole bracket. Below the
+# colours come who floats, the higher ranked players staying in, then
+# the top half of a score group meeting its bottom half.
+BASE_WEIGHT = 10 ** 14
+REMATCH_PENALTY = 10 ** 12
+SCORE_PENALTY = 10 ** 9
+COLOR_PENALTY = 10 ** 8
+RANK_WEIGHT = 10 ** 4
+
+# Most brackets' worth of players the bottom bracket grows to by reopening
+# the brackets above it before it allows a rematch.
+REOPEN_BRACKETS = 4
+
+# Waiting players a newcomer is tried against in random_pairings.
+LOOKAHEAD = 8
+
+
+class PairingError(Exception):
+    pass
+
+
+def color_preference(balance):
+    if balance > 0:
+        return 1
+    if balance < 0:
+        return -1
+    return 0
+
+
+def _pair_weight(i, j, rank_i, rank_j, size, scores, colors, rematch,
+                 fold):
+    # fold: how far the pair is from top half against bottom half when
+    # both players have the same score.
+    diff = scores[i] - scores[j]
+    weight = BASE_WEIGHT - SCORE_PENALTY * diff * diff
+    if rematch:
+        weight -= REMATCH_PENALTY
+    if colors is not None:
+        preference = color_preference(colors[i])
+        if preference and preference == color_preference(colors[j]):
+            weight -= COLOR_PENALTY
+            if abs(colors[i]) > 1 and abs(colors[j]) > 1:
+                weight -= COLOR_PENALTY
+    # Prefer pairing the higher ranked players when someone has to be
+    # left over for the next bracket.
+    return weight + RANK_WEIGHT * (2 * size - rank_i - rank_j) - fold
+
+
+def _bye_weight(i, rank, scores, low_score, repeat):
+    weight = BASE_WEIGHT - SCORE_PENALTY * (scores[i] - low_score)
+    if repeat:
+        weight -= REMATCH_PENALTY
+    return weight + RANK_WEIGHT * rank
+
+
+def _group_positions(bracket, scores):
+    # {rank in bracket: (position in its score group, half the group)}.
+    groups = {}
+    for rank, i in enumerate(bracket):
+        groups.setdefault(scores[i], []).append(rank)
+    positions = {}
+    for ranks in groups.values():
+        for position, rank in enumerate(ranks):
+            positions[rank] = (position, len(ranks) // 2)
+    return positions
+
+
+def _solve_bracket(bracket, scores, have_met, colors, had_bye, with_bye,
+                   relaxed):
+    size = len(bracket)
+    positions = _group_positions(bracket, scores)
+    edges = []
+    for rank_i in range(size):
+        i = bracket[rank_i]
+        position_i, half = positions[rank_i]
+        for rank_j in range(rank_i + 1, size):
+            j = bracket[rank_j]
+            rematch = have_met(i, j)
+            if rematch and not relaxed:
+                continue
+            fold = 0
+            if scores[i] == scores[j]:
+                fold = abs(positions[rank_j][0] - position_i - half)
+            edges.append((rank_i, rank_j, _pair_weight(
+                i, j, rank_i, rank_j, size, scores, colors, rematch,
+                fold)))
+
+    if with_bye:
+        low_score = min(scores[i] for i in bracket)
+        for rank in range(size):
+            i = bracket[rank]
+            repeat = had_bye is not None and had_bye(i)
+            if repeat and not relaxed:
+                continue
+            edges.append((rank, size, _bye_weight(i, rank, scores,
+                                                  low_score, repeat)))
+
+    mate = max_weight_matching(edges, maxcardinality=True)
+    mate += [-1] * (size + 1 - len(mate))
+
+    pairs = []
+    bye = None
+    unpaired = []
+    for rank in range(size):
+        other = mate[rank]
+        if other == -1:
+            unpaired.append(bracket[rank])
+        elif other == size:
+            bye = bracket[rank]
+        elif rank < other:
+            pairs.append((bracket[rank], bracket[other]))
+    return pairs, bye, unpaired
+
+
+def _orient(pair, colors):
+    # The first player of a pair is the one with the higher rank; give
+    # white to whoever has had it less often, ties to the higher rank.
+    i, j = pair
+    if colors is not None and colors[j] < colors[i]:
+        return j, i
+    return i, j
+
+
+def _cached_bracket(cache, bracket, scores, have_met, colors, had_bye,
+                    with_bye, relaxed):
+    if cache is None:
+        return _solve_bracket(bracket, scores, have_met, colors, had_bye,
+                              with_bye, relaxed)
+    key = (tuple(bracket), tuple(scores[i] for i in bracket), with_bye,
+           relaxed)
+    solution = cache.get(key)
+    if solution is None:
+        solution = cache[key] = _solve_bracket(
+            bracket, scores, have_met, colors, had_bye, with_bye, relaxed
+        )
+    return solution
+
+
+def swiss_pairings(scores, have_met, colors=None, had_bye=None,
+                   bracket_size=BRACKET_SIZE, order=None, cache=None):
+    # scores, colors: per player index; colors hold whites minus blacks.
+    # have_met(i, j) and had_bye(i) answer from the pairing history.
+    # order, when given, lists the indexes by standing, best first.
+    # cache, a dict, keeps bracket solutions between calls made with the
+    # same history and colors, so only brackets whose players or scores
+    # changed are solved again.
+    # Returns ([(white, black), ...], bye) with player indexes.
+    n = len(scores)
+    # Half points as integers keep every weight integral.
+    scores = [int(round(score * 2)) for score in scores]
+    if order is None:
+        order = sorted(range(n), key=lambda i: -scores[i])
+
+    rank = {player: position for position, player in enumerate(order)}
+    pairs = []
+    # Pairs made by each bracket, so the bottom one can reopen them.
+    bracket_sizes = []
+    bye = None
+    floaters = []
+    position = 0
+    while position < n:
+        end = min(n, position + max(2, bracket_size - len(floaters)))
+        # Finish the score group in progress when it ends close by.
+        group_end = end
+        while group_end < n and \
+                scores[order[group_end]] == scores[order[group_end - 1]]:
+            group_end += 1
+        if group_end - end <= bracket_size // 2:
+            end = group_end
+        if (len(floaters) + end - position) % 2 and end < n:
+            end += 1
+        if n - end < 2:
+            end = n
+
+        bracket = floaters + order[position:end]
+        position = end
+        last = position >= n
+        with_bye = last and len(bracket) % 2 == 1
+
+        bracket_pairs, bracket_bye, floaters = _cached_bracket(
+            cache, bracket, scores, have_met, colors, had_bye, with_bye,
+            False
+        )
+        # No pairing of the bottom bracket avoids every rematch and
+        # repeated bye: reopen the brackets above, up to REOPEN_BRACKETS
+        # brackets' worth of players, and only then allow them at a high
+        # cost.
+        while last and (floaters or (with_bye and bracket_bye is None)) \
+                and bracket_sizes and \
+                len(bracket) < REOPEN_BRACKETS * bracket_size:
+            reopened = pairs[len(pairs) - bracket_sizes.pop():]
+            del pairs[len(pairs) - len(reopened):]
+            bracket = sorted(bracket + [i for pair in reopened
+                                        for i in pair],
+                             key=rank.__getitem__)
+            bracket_pairs, bracket_bye, floaters = _cached_bracket(
+                cache, bracket, scores, have_met, colors, had_bye,
+                with_bye, False
+            )
+        if last and (floaters or (with_bye and bracket_bye is None)):
+            bracket_pairs, bracket_bye, floaters = _cached_bracket(
+                cache, bracket, scores, have_met, colors, had_bye,
+                with_bye, True
+            )
+        pairs.extend(bracket_pairs)
+        bracket_sizes.append(len(bracket_pairs))
+        if bracket_bye is not None:
+            bye = bracket_bye
+
+    if floaters:
+        raise PairingError(f"{len(floaters)} players could not be paired.")
+
+    pairs.sort(key=lambda pair: min(rank[pair[0]], rank[pair[1]]))
+    pairs = [_orient(tuple(sorted(pair, key=rank.__getitem__)), colors)
+             for pair in pairs]
+    return pairs, bye
+
+
+def new_seed():
+    return randrange(2 ** 32)
+
+
+def _repair(pool, have_met):
+    edges = [(a, b, 1)
+             for a in range(len(pool)) for b in range(a + 1, len(pool))
+             if not have_met(pool[a], pool[b])]
+    mate = max_weight_matching(edges, maxcardinality=True)
+    mate += [-1] * (len(pool) - len(mate))
+    pairs = [(pool[a], pool[b]) for a, b in enumerate(mate) if a < b]
+    unpaired = [pool[a] for a, b in enumerate(mate) if b == -1]
+    return pairs, unpaired
+
+
+def random_pairings(n, have_met=None, seed=None):
+    # Shuffles the players with the given seed and pairs each one with a
+    # recent waiting player they have not met. The same seed and history
+    # always give the same pairing. Returns ([(i, j), ...], bye).
+    order = list(range(n))
+    Random(seed).shuffle(order)
+
+    pairs = []
+    waiting = []
+    for i in order:
+        partner = None
+        for k in range(len(waiting) - 1,
+                       max(-1, len(waiting) - 1 - LOOKAHEAD), -1):
+            if have_met is None or not have_met(waiting[k], i):
+                partner = k
+                break
+        if partner is None:
+            waiting.append(i)
+        else:
+            pairs.append((waiting.pop(partner), i))
+
+    reopened = 0
+    while len(waiting) > n % 2:
+        # The greedy pass got stuck: re-pair the stuck players together
+        # with the last few pairs, widening until it works or the whole
+        # field proves that no valid pairing exists.
+        kept = len(pairs) - reopened
+        pool = waiting + [i for pair in pairs[kept:] for i in pair]
+        repaired, unpaired = _repair(pool, have_met)
+        if len(unpaired) <= n % 2:
+            del pairs[kept:]
+            pairs.extend(repaired)
+            waiting = unpaired
+        elif kept == 0:
+            raise PairingError("No pairing avoids every rematch.")
+        else:
+            reopened = min(max(1, 2 * reopened), len(pairs))
+
+    return pairs, waiting[0] if waiting else None
@@ -0,0 +1,209 @@
+import json
+import os
+import sys
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from locking import atomic_dump
+
+
+RATINGS_FILE = 'ratings.json'
+DEFAULT_RATING = 1500.0
+
+# K-factors: new players move fast, strong players slowly.
+PROVISIONAL_GAMES = 30
+PROVISIONAL_K = 40
+K = 20
+MASTER_RATING = 2400
+MASTER_K = 10
+
+# Nobody drops below RATING_FLOOR, nor more than FLOOR_BELOW_PEAK points
+# under the best rating they ever reached.
+RATING_FLOOR = 1000.0
+FLOOR_BELOW_PEAK = 200.0
+
+
+def pending_rounds(storage, processed, finished):
+    # Yields (start_datetime, tournament_id, round_num, games) for each
+    # finished round not rated yet, games being (white, black, white's
+    # points) tuples. Rounds are only rated in order within a tournament.
+    for summary in storage.list_tournaments():
+        tournament_id = summary.tournament_id
+        if tournament_id in finished:
+            continue
+        tournament = storage.load_tournament(tournament_id)
+        done = processed.get(tournament_id, 0)
+        for round_num in range(done, len(tournament.rounds)):
+            round_data = tournament.rounds[round_num]
+            if round_data.end_datetime is None:
+                break
+            games = [(match.player1.chess_id, match.player2.chess_id,
+                      match.score1)
+                     for match in round_data.matches
+                     if not match.is_bye and match.result is not None]
+            yield (round_data.start_datetime, tournament_id, round_num,
+                   games)
+        if summary.status == 'finished':
+            finished.add(tournament_id)
+
+
+def batches(rounds):
+    # Groups consecutive rounds that share no player: rating them together
+    # gives the same result as one after the other, in a single pass.
+    batch = []
+    seen = set()
+    for round_info in rounds:
+        players = {chess_id for white, black, _ in round_info[3]
+                   for chess_id in (white, black)}
+        if batch and not seen.isdisjoint(players):
+            yield batch
+            batch = []
+            seen = set()
+        batch.append(round_info)
+        seen |= players
+    if batch:
+        yield batch
+
+
+class RatingTable:
+    def __init__(self, ratings=None, processed=None, finished=None):
+        # One slot per player in three parallel arrays, so a whole batch
+        # of games is rated with a few vector operations.
+        self.chess_ids = []
+        self.index = {}
+        self.ratings = array('d')
+        self.peaks = array('d')
+        self.games = array('i')
+        self.processed = processed or {}
+        self.finished = set(finished or ())
+        for chess_id, entry in (ratings or {}).items():
+            i = self.slot(chess_id)
+            self.ratings[i] = entry['rating']
+            self.peaks[i] = entry.get('peak', entry['rating'])
+            self.games[i] = entry.get('games', 0)
+
+    def __len__(self):
+        return len(self.chess_ids)
+
+    def slot(self, chess_id):
+        i = self.index.get(chess_id)
+        if i is None:
+            i = self.index[chess_id] = len(self.chess_ids)
+            self.chess_ids.append(chess_id)
+            self.ratings.append(DEFAULT_RATING)
+            self.peaks.append(DEFAULT_RATING)
+            self.games.append(0)
+        return i
+
+    def rating(self, chess_id):
+        i = self.index.get(chess_id)
+        return DEFAULT_RATING if i is None else self.ratings[i]
+
+    def to_dict(self):
+        return {
+            'ratings': {
+                chess_id: {
+                    'rating': round(self.ratings[i], 1),
+                    'peak': round(self.peaks[i], 1),
+                    'games': self.games[i],
+                }
+                for i, chess_id in enumerate(self.chess_ids)
+            },
+            'processed': self.processed,
+            'finished': sorted(self.finished),
+        }
+
+    @staticmethod
+    def load(path=RATINGS_FILE):
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return RatingTable(**json.load(f))
+        else:
+            return RatingTable()
+
+    def save(self, path=RATINGS_FILE):
+        atomic_dump(self.to_dict(), path)
+
+    def update(self, storage):
+        # Rates every round finished since the last update, oldest first.
+        # Returns the number of games rated.
+        rounds = sorted(pending_rounds(storage, self.processed,
+                                       self.finished),
+                        key=lambda round_info: round_info[0])
+        rated = 0
+        for batch in batches(rounds):
+            white = array('i')
+            black = array('i')
+            points = array('d')
+            for _, tournament_id, round_num, games in batch:
+                for white_id, black_id, score in games:
+                    white.append(self.slot(white_id))
+                    black.append(self.slot(black_id))
+                    points.append(score)
+                self.processed[tournament_id] = round_num + 1
+            if points:
+                self.rate(white, black, points)
+            rated += len(points)
+        return rated
+
+    def rate(self, white, black, points):
+        # No player appears twice in one batch, so every update reads the
+        # ratings from before the batch.
+        if numpy is not None:
+            self._rate_numpy(white, black, points)
+        else:
+            self._rate_array(white, black, points)
+
+    def _rate_numpy(self, white, black, points):
+        ratings = numpy.frombuffer(self.ratings, dtype=numpy.double)
+        peaks = numpy.frombuffer(self.peaks, dtype=numpy.double)
+        games = numpy.frombuffer(self.games, dtype=numpy.intc)
+        white = numpy.frombuffer(white, dtype=numpy.intc)
+        black = numpy.frombuffer(black, dtype=numpy.intc)
+        points = numpy.frombuffer(points, dtype=numpy.double)
+
+        expected = 1 / (1 + 10 ** ((ratings[black] - ratings[white]) / 400))
+        for players, change in ((white, points - expected),
+                                (black, expected - points)):
+            k = numpy.where(ratings[players] >= MASTER_RATING, MASTER_K, K)
+            k = numpy.where(games[players] < PROVISIONAL_GAMES,
+                            PROVISIONAL_K, k)
+            floor = numpy.maximum(RATING_FLOOR,
+                                  peaks[players] - FLOOR_BELOW_PEAK)
+            ratings[players] = numpy.maximum(
+                floor, ratings[players] + k * change)
+            peaks[players] = numpy.maximum(peaks[players], ratings[players])
+            games[players] += 1
+
+    def _rate_array(self, white, black, points):
+        ratings = self.ratings
+        expected = [1 / (1 + 10 ** ((ratings[b] - ratings[w]) / 400))
+                    for w, b in zip(white, black)]
+        for players, sign in ((white, 1), (black, -1)):
+            for i, e, score in zip(players, expected, points):
+                rating = ratings[i]
+                if self.games[i] < PROVISIONAL_GAMES:
+                    k = PROVISIONAL_K
+                elif rating >= MASTER_RATING:
+                    k = MASTER_K
+                else:
+                    k = K
+                floor = max(RATING_FLOOR, self.peaks[i] - FLOOR_BELOW_PEAK)
+                ratings[i] = max(floor, rating + k * sign * (score - e))
+                self.peaks[i] = max(self.peaks[i], ratings[i])
+                self.games[i] += 1
+
+
+if __name__ == '__main__':
+    from storage import open_storage
+
+    # Recomputes the whole table from the archive.
+    storage = open_storage(sys.argv[1] if len(sys.argv) > 1 else None)
+    table = RatingTable()
+    print(f"{table.update(storage)} games rated for {len(table)} players.")
+    table.save()
+    storage.close()
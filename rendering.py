@@ -0,0 +1,59 @@
+import sys
+from itertools import islice
+
+
+# Lines shown per page on a terminal.
+PAGE_SIZE = 40
+
+# Lines joined into a single write when output is not paged.
+BUFFER_LINES = 4096
+
+
+def pages(lines, page_size):
+    lines = iter(lines)
+    while True:
+        page = list(islice(lines, page_size))
+        if not page:
+            return
+        yield page
+
+
+def write_lines(lines, out=None, buffer_lines=BUFFER_LINES):
+    # Writes lines in large chunks instead of one print() each. Returns
+    # the number of lines written.
+    out = out if out is not None else sys.stdout
+    written = 0
+    for chunk in pages(lines, buffer_lines):
+        out.write('\n'.join(chunk) + '\n')
+        written += len(chunk)
+    out.flush()
+    return written
+
+
+class Pager:
+    # Shows lines a page at a time when both ends are a terminal, asking
+    # before each further page; lines are only produced as pages are
+    # shown, so the first page of a long listing comes up at once.
+    # Anything but Enter at the prompt stops the listing. Redirected
+    # output is written in full, in buffered chunks.
+    def __init__(self, page_size=PAGE_SIZE, out=None, prompt=input):
+        self.page_size = page_size
+        self.out = out if out is not None else sys.stdout
+        self.prompt = prompt
+
+    def interactive(self):
+        return self.out.isatty() and sys.stdin.isatty()
+
+    def show(self, lines):
+        # Returns the number of lines shown.
+        if not self.interactive():
+            return write_lines(lines, self.out)
+        shown = 0
+        for page in pages(lines, self.page_size):
+            if shown and self.prompt("-- More (Enter to continue, q to "
+                                     "stop) -- ").strip():
+                break
+            self.out.write('\n'.join(page) + '\n')
+            self.out.flush()
+            shown += len(page)
+        return shown
@@ -0,0 +1,145 @@
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import chain
+
+from journal import RecordBatch
+from models import Round
+from pairing import PairingError, swiss_pairings
+
+
+PairingReport = namedtuple(
+    'PairingReport', 'sections paired failed seconds sections_per_second'
+)
+
+
+class SectionState:
+    # What the pairing engine needs from one tournament, in plain lists
+    # and sets of player indexes so it pickles small and fast.
+    __slots__ = ('tournament_id', 'scores', 'colors', 'met', 'byes')
+
+    def __init__(self, tournament):
+        players = tournament.players
+        n = len(players)
+        index = {player.chess_id: i for i, player in enumerate(players)}
+        history = tournament.history
+
+        self.tournament_id = tournament.tournament_id
+        self.scores = [player.score for player in players]
+        self.colors = [history.colors.get(player.chess_id, 0)
+                       for player in players]
+        self.met = set()
+        for pair in history.pairs:
+            indexes = sorted(index[chess_id] for chess_id in pair
+                             if chess_id in index)
+            if len(indexes) == 2:
+                self.met.add(indexes[0] * n + indexes[1])
+        self.byes = {index[chess_id] for chess_id in history.byes
+                     if chess_id in index}
+
+
+def pair_section(state):
+    # Runs in a worker process. Returns (tournament_id, (pairs, bye), None)
+    # or (tournament_id, None, error message).
+    n = len(state.scores)
+    met = state.met
+    try:
+        pairing = swiss_pairings(
+            state.scores,
+            lambda i, j: min(i, j) * n + max(i, j) in met,
+            state.colors,
+            state.byes.__contains__
+        )
+    except PairingError as e:
+        return state.tournament_id, None, str(e)
+    return state.tournament_id, pairing, None
+
+
+def ready_to_pair(tournament):
+    if len(tournament.players) < tournament.min_players:
+        return False
+    if len(tournament.rounds) >= tournament.num_rounds:
+        return False
+    return all(round_data.end_datetime is not None
+               for round_data in tournament.rounds)
+
+
+def scheduled_rounds(tournaments):
+    # (tournament_id, matches, error message) for the round-robin ones.
+    for tournament in tournaments:
+        if tournament.pairing_system == 'swiss':
+            continue
+        try:
+            yield (tournament.tournament_id,
+                   tournament.generate_round_robin_matches(), None)
+        except PairingError as e:
+            yield tournament.tournament_id, None, str(e)
+
+
+def pair_next_rounds(storage, workers=None):
+    # Pairs the next round of every tournament whose previous round is
+    # finished, spreading the sections over a process pool, and saves all
+    # the new rounds in one batch. Returns (PairingReport, {tournament_id:
+    # error message}) for the sections that could not be paired.
+    started = time.perf_counter()
+    tournaments = {}
+    for summary in storage.list_tournaments():
+        if summary.status == 'finished':
+            continue
+        tournament = storage.load_tournament(summary.tournament_id)
+        if ready_to_pair(tournament):
+            tournaments[tournament.tournament_id] = tournament
+
+    # Round-robin sections only look up their schedule: they are paired
+    # here, the Swiss ones in the pool.
+    states = [SectionState(tournament)
+              for tournament in tournaments.values()
+              if tournament.pairing_system == 'swiss']
+    workers = max(1, min(workers or os.cpu_count() or 1, len(states)))
+    if workers == 1:
+        results = map(pair_section, states)
+    else:
+        executor = ProcessPoolExecutor(workers)
+        results = executor.map(pair_section, states,
+                               chunksize=max(1, len(states) // (workers * 4)))
+
+    batches = {}
+    sinks = {}
+    errors = {}
+    try:
+        for tournament_id, matches, error in chain(
+            scheduled_rounds(tournaments.values()),
+            ((tournament_id, None if error is not None else
+              tournaments[tournament_id].swiss_matches(*pairing), error)
+             for tournament_id, pairing, error in results)
+        ):
+            if error is not None:
+                errors[tournament_id] = error
+                continue
+            tournament = tournaments[tournament_id]
+            sink = tournament.journal
+            batch = batches.get(id(sink))
+            if batch is None:
+                batch = batches[id(sink)] = RecordBatch(sink)
+            sinks[tournament_id] = sink
+            tournament.journal = batch
+            tournament.add_round(Round(
+                f"Round {len(tournament.rounds) + 1}",
+                datetime.now().isoformat(),
+                matches=matches
+            ))
+    finally:
+        if workers > 1:
+            executor.shutdown()
+        for tournament_id, sink in sinks.items():
+            tournaments[tournament_id].journal = sink
+        for batch in batches.values():
+            batch.flush()
+
+    seconds = time.perf_counter() - started
+    paired = len(sinks)
+    report = PairingReport(len(tournaments), paired, len(errors), seconds,
+                           paired / seconds if seconds else 0.0)
+    return report, errors
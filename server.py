@@ -0,0 +1,214 @@
+import asyncio
+import json
+import sys
+import traceback
+from collections import defaultdict
+from datetime import datetime
+
+from journal import RecordBatch
+from models import RESULT_POINTS, Round, WriteConflict
+from pairing import PairingError
+from storage import open_storage
+
+
+HOST = '127.0.0.1'
+PORT = 8765
+
+# Seconds between two writes of the buffered journal records.
+FLUSH_INTERVAL = 0.5
+
+
+class ArbiterServer:
+    # Serves the controller operations to many arbiter terminals at once.
+    # Each connection sends one JSON request per line and gets one JSON
+    # response per line, {"ok": true, ...} or {"ok": false, "error": ...}.
+    def __init__(self, storage, flush_interval=FLUSH_INTERVAL):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.tournaments = {}
+        self.batches = {}
+        self.locks = defaultdict(asyncio.Lock)
+
+    def tournament(self, tournament_id):
+        tournament = self.tournaments.get(tournament_id)
+        if tournament is None:
+            tournament = self.storage.load_tournament(tournament_id)
+            if tournament is None:
+                raise LookupError(f"Unknown tournament {tournament_id}.")
+            sink = tournament.journal
+            # Reloaded after a conflict, the JSON storage hands back the
+            # same object, already batched.
+            if not isinstance(sink, RecordBatch):
+                batch = self.batches.get(id(sink))
+                if batch is None:
+                    batch = self.batches[id(sink)] = RecordBatch(sink)
+                tournament.journal = batch
+            self.tournaments[tournament_id] = tournament
+        return tournament
+
+    def flush(self):
+        for batch in self.batches.values():
+            try:
+                batch.flush()
+            except WriteConflict as e:
+                # Another process got there first: load the tournaments
+                # whose changes were dropped again on their next request.
+                print(f"Dropped changes: {e}", file=sys.stderr)
+                for record in e.records:
+                    self.tournaments.pop(record['tournament'], None)
+        self.storage.checkpoint()
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = await self.dispatch(json.loads(line))
+                    response['ok'] = True
+                except (ValueError, LookupError, PairingError) as e:
+                    response = {'ok': False, 'error': str(e)}
+                except Exception as e:
+                    # A bug in one request must not cut the terminal off:
+                    # log it and answer like any other failed request.
+                    traceback.print_exc()
+                    response = {'ok': False,
+                                'error': f"Internal error: {e!r}"}
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request):
+        if not isinstance(request, dict):
+            raise ValueError("A request must be a JSON object.")
+        op = request.get('op')
+        if op == 'tournaments':
+            return self.list_tournaments()
+        if op not in ('matches', 'result', 'next_round'):
+            raise ValueError(f"Unknown operation {op!r}.")
+
+        tournament_id = request.get('tournament')
+        if not isinstance(tournament_id, str):
+            raise ValueError("tournament must be a tournament id string.")
+        if op == 'result':
+            board = request.get('board')
+            result = request.get('result')
+            # bool is an int too, but true is no board number.
+            if type(board) is not int:
+                raise ValueError(f"Invalid board {board!r}.")
+            if not isinstance(result, str):
+                raise ValueError(f"Invalid result {result!r}.")
+
+        tournament = self.tournament(tournament_id)
+        async with self.locks[tournament_id]:
+            if op == 'matches':
+                return self.show_matches(tournament)
+            if op == 'result':
+                return self.submit_result(tournament, board, result)
+            return self.next_round(tournament)
+
+    def list_tournaments(self):
+        return {'tournaments': [summary._asdict() for summary in
+                                self.storage.list_tournaments()]}
+
+    def show_matches(self, tournament):
+        if not tournament.rounds:
+            return {'round': None, 'matches': []}
+        round_data = tournament.rounds[-1]
+        return {
+            'round': round_data.name,
+            'finished': round_data.end_datetime is not None,
+            'matches': [
+                {
+                    'board': board,
+                    'white': match.player1.chess_id,
+                    'black': (match.player2.chess_id
+                              if match.player2 is not None else None),
+                    'result': match.result,
+                }
+                for board, match in enumerate(round_data.matches, start=1)
+            ],
+        }
+
+    def submit_result(self, tournament, board, result):
+        if not tournament.rounds or \
+                tournament.rounds[-1].end_datetime is not None:
+            raise ValueError("No round is in progress.")
+        round_num = len(tournament.rounds) - 1
+        matches = tournament.rounds[round_num].matches
+        if not 1 <= board <= len(matches):
+            raise ValueError(f"Invalid board {board!r}.")
+        if matches[board - 1].is_bye:
+            raise ValueError(f"Board {board} is a bye.")
+        if result not in RESULT_POINTS:
+            raise ValueError(f"Invalid result {result!r}.")
+
+        tournament.record_result(round_num, board - 1, result)
+        return {'board': board, 'result': result}
+
+    def next_round(self, tournament):
+        # Closes the round in progress once every board has a result and
+        # pairs the next one.
+        if tournament.rounds:
+            round_num = len(tournament.rounds) - 1
+            round_data = tournament.rounds[round_num]
+            # Rounds paired before byes were scored on pairing.
+            for board, match in enumerate(round_data.matches):
+                if match.is_bye and match.result is None:
+                    tournament.record_result(round_num, board, '1')
+            missing = [board for board, match in
+                       enumerate(round_data.matches, start=1)
+                       if match.result is None]
+            if missing:
+                raise ValueError(f"Boards without a result: {missing}.")
+            if round_data.end_datetime is None:
+                tournament.end_round(round_num)
+
+        if len(tournament.rounds) >= tournament.num_rounds:
+            self.flush()
+            return {'round': None, 'finished': True}
+        if len(tournament.players) < tournament.min_players:
+            raise ValueError(f"At least {tournament.min_players} players "
+                             "are required.")
+
+        round_num = len(tournament.rounds)
+        round_data = Round(f"Round {round_num + 1}",
+                           datetime.now().isoformat(),
+                           matches=tournament.generate_next_matches())
+        tournament.add_round(round_data)
+        self.flush()
+        if self.tournaments.get(tournament.tournament_id) is not tournament:
+            raise WriteConflict(f"Round {round_num + 1} was paired "
+                                "elsewhere meanwhile.")
+        return self.show_matches(tournament)
+
+    async def serve(self, host=HOST, port=PORT):
+        server = await asyncio.start_server(self.handle, host, port)
+        flusher = asyncio.ensure_future(self.flush_periodically())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            flusher.cancel()
+            self.flush()
+
+
+if __name__ == '__main__':
+    storage = open_storage(sys.argv[1] if len(sys.argv) > 1 else None)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else PORT
+    print(f"Listening on {HOST}:{port}")
+    try:
+        asyncio.run(ArbiterServer(storage).serve(port=port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        storage.close()
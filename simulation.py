@@ -0,0 +1,152 @@
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from random import Random
+
+from pairing import new_seed, swiss_pairings
+from ratings import DEFAULT_RATING
+
+# Share of games drawn between equally rated players; the draw chance
+# shrinks as the rating gap grows, keeping the Elo expected score.
+DRAW_RATE = 0.3
+
+# Runs are split into this many chunks, each with its own random stream,
+# whatever the number of workers, so a seed gives the same result on any
+# machine.
+CHUNKS = 64
+
+
+class SimulationState:
+    # Everything a worker needs to play out a tournament, in plain arrays
+    # indexed by player position: cheap to pickle and to copy per run.
+    def __init__(self, tournament, ratings=None):
+        players = tournament.players
+        n = len(players)
+        index = {player.chess_id: i for i, player in enumerate(players)}
+
+        self.chess_ids = [player.chess_id for player in players]
+        self.ratings = array('d', (
+            DEFAULT_RATING if ratings is None
+            else ratings.rating(player.chess_id)
+            for player in players
+        ))
+        # Half points, so every score stays an integer.
+        self.scores = array('i', (int(round(player.score * 2))
+                                  for player in players))
+        self.colors = array('i', [0]) * n
+        self.met = set()
+        self.byes = set()
+        self.pending = []
+
+        for round_data in tournament.rounds:
+            for match in round_data.matches:
+                i = index[match.player1.chess_id]
+                if match.player2 is None:
+                    self.byes.add(i)
+                    continue
+                j = index[match.player2.chess_id]
+                self.met.add(min(i, j) * n + max(i, j))
+                self.colors[i] += 1
+                self.colors[j] -= 1
+                if match.result is None:
+                    self.pending.append((i, j))
+
+        self.rounds_left = tournament.num_rounds - len(tournament.rounds)
+
+
+def game_points(white_rating, black_rating, roll):
+    # White's half points for one simulated game, roll in [0, 1).
+    expected = 1 / (1 + 10 ** ((black_rating - white_rating) / 400))
+    draw = DRAW_RATE * (1 - abs(2 * expected - 1))
+    win = expected - draw / 2
+    if roll < win:
+        return 2
+    if roll < win + draw:
+        return 1
+    return 0
+
+
+def play_out(state, rng):
+    # Plays the remaining games once and returns the final half-point
+    # scores. Only the score, color and pairing sets are copied.
+    n = len(state.chess_ids)
+    ratings = state.ratings
+    scores = array('i', state.scores)
+    colors = array('i', state.colors)
+    met = set(state.met)
+    byes = set(state.byes)
+
+    def play(pairs):
+        for i, j in pairs:
+            points = game_points(ratings[i], ratings[j], rng.random())
+            scores[i] += points
+            scores[j] += 2 - points
+
+    play(state.pending)
+    for _ in range(state.rounds_left):
+        pairs, bye = swiss_pairings(
+            [score / 2 for score in scores],
+            lambda i, j: min(i, j) * n + max(i, j) in met,
+            colors,
+            byes.__contains__
+        )
+        play(pairs)
+        for i, j in pairs:
+            met.add(min(i, j) * n + max(i, j))
+            colors[i] += 1
+            colors[j] -= 1
+        if bye is not None:
+            scores[bye] += 2
+            byes.add(bye)
+    return scores
+
+
+def simulate_chunk(state, runs, seed):
+    # Returns a flat players x positions array of finishing counts.
+    # Tied players are ordered at random.
+    n = len(state.chess_ids)
+    rng = Random(seed)
+    counts = array('i', [0]) * (n * n)
+    for _ in range(runs):
+        scores = play_out(state, rng)
+        order = sorted(range(n), key=lambda i: (-scores[i], rng.random()))
+        for position, i in enumerate(order):
+            counts[i * n + position] += 1
+    return counts
+
+
+def simulate(tournament, runs=1000, ratings=None, seed=None, workers=None):
+    # Plays the rest of the tournament runs times over a process pool and
+    # returns {chess_id: [chance of finishing 1st, 2nd, ...]}.
+    state = SimulationState(tournament, ratings)
+    n = len(state.chess_ids)
+    if seed is None:
+        seed = new_seed()
+    chunk_count = max(1, min(CHUNKS, runs))
+    chunks = [runs // chunk_count + (k < runs % chunk_count)
+              for k in range(chunk_count)]
+    # One independent stream per chunk, reproducible from the seed.
+    seeds = [f'{seed}-{k}' for k in range(chunk_count)]
+    workers = max(1, min(workers or os.cpu_count() or 1, chunk_count))
+
+    counts = array('i', [0]) * (n * n)
+    if workers == 1:
+        results = list(map(simulate_chunk, [state] * chunk_count, chunks,
+                            seeds))
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(simulate_chunk,
+                                        [state] * chunk_count, chunks,
+                                        seeds))
+    for chunk in results:
+        for k, count in enumerate(chunk):
+            counts[k] += count
+
+    return {chess_id: [count / runs for count in counts[i * n:(i + 1) * n]]
+            for i, chess_id in enumerate(state.chess_ids)}
+
+
+def prize_chances(distribution, places=3):
+    # {chess_id: chance of finishing in the first places positions}.
+    return {chess_id: sum(chances[:places])
+            for chess_id, chances in distribution.items()}
@@ -0,0 +1,848 @@
+import json
+import os
+import re
+import sqlite3
+from bisect import insort
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import islice
+from operator import attrgetter
+
+from journal import Journal
+from locking import DataLock, atomic_dump
+from models import (PLAYER_FIELDS, RESULT_POINTS, Match, Player, Round,
+                    Tournament, TournamentEntry, WriteConflict)
+
+
+# Journal records written before the JSON snapshot is rewritten.
+COMPACT_EVERY = 500
+
+# chess_ids looked up per SQLite query, below its bound parameter limit.
+LOOKUP_BATCH = 500
+
+LAST_NAME = attrgetter('last_name')
+
+TournamentSummary = namedtuple(
+    'TournamentSummary',
+    'tournament_id name location start_date end_date status'
+)
+
+
+def tournament_status(num_rounds, rounds_started, rounds_open):
+    if rounds_started == 0:
+        return 'not started'
+    if rounds_started >= num_rounds and rounds_open == 0:
+        return 'finished'
+    return 'in progress'
+
+
+def player_matches(player, search):
+    # search: lower-cased text found in the name or chess ID.
+    return (search in player.last_name.lower()
+            or search in player.first_name.lower()
+            or search in player.chess_id.lower())
+
+
+def summarize(tournament):
+    rounds_open = sum(1 for round_data in tournament.rounds
+                      if round_data.end_datetime is None)
+    return TournamentSummary(
+        tournament.tournament_id, tournament.name, tournament.location,
+        tournament.start_date, tournament.end_date,
+        tournament_status(tournament.num_rounds, len(tournament.rounds),
+                          rounds_open)
+    )
+
+
+class JsonPlayerStorage:
+    def __init__(self):
+        self.players_lock = DataLock('players.json')
+        with self.players_lock.hold() as lock:
+            self.players_version = lock.read()['version']
+            self.players = Player.load_players()
+        self.players_by_id = {p.chess_id: p for p in self.players}
+        # The players sorted by last name, built on the first listing and
+        # kept up to date as players are added.
+        self.players_index = None
+
+    def sorted_players(self):
+        if self.players_index is None:
+            self.players_index = sorted(self.players, key=LAST_NAME)
+        return self.players_index
+
+    def iter_players(self, offset=0, limit=None, search=None):
+        players = self.sorted_players()
+        if search:
+            search = search.lower()
+            players = (player for player in players
+                       if player_matches(player, search))
+        return islice(players, offset,
+                      None if limit is None else offset + limit)
+
+    def get_player(self, chess_id):
+        return self.players_by_id.get(chess_id)
+
+    def get_players(self, chess_ids):
+        players_by_id = self.players_by_id
+        return {chess_id: players_by_id[chess_id] for chess_id in chess_ids
+                if chess_id in players_by_id}
+
+    def add_player(self, player):
+        self.add_players([player])
+
+    def add_players(self, players):
+        for player in players:
+            self.players.append(player)
+            self.players_by_id[player.chess_id] = player
+            if self.players_index is not None:
+                insort(self.players_index, player, key=LAST_NAME)
+        self.save_players(players)
+
+    def update_player(self, chess_id, player):
+        removed = ()
+        if chess_id != player.chess_id:
+            del self.players_by_id[chess_id]
+            self.players_by_id[player.chess_id] = player
+            removed = (chess_id,)
+        self.players_index = None
+        self.save_players([player], removed)
+
+    def import_players(self, chunks):
+        # Upserts chunks of players by chess_id and saves them in one
+        # write. Returns (added, updated); identical players are skipped.
+        added = updated = 0
+        changed = []
+        for chunk in chunks:
+            for player in chunk:
+                existing = self.players_by_id.get(player.chess_id)
+                if existing is None:
+                    self.players.append(player)
+                    self.players_by_id[player.chess_id] = player
+                    changed.append(player)
+                    added += 1
+                elif any(getattr(existing, field) != getattr(player, field)
+                         for field in PLAYER_FIELDS):
+                    for field in PLAYER_FIELDS:
+                        setattr(existing, field, getattr(player, field))
+                    changed.append(existing)
+                    updated += 1
+        if changed:
+            self.players_index = None
+            self.save_players(changed)
+        return added, updated
+
+    def save_players(self, changed, removed=()):
+        with self.players_lock.hold() as lock:
+            if lock.read()['version'] != self.players_version:
+                self.merge_players(changed, removed)
+            Player.save_players(self.players)
+            self.players_version = lock.bump()['version']
+
+    def merge_players(self, changed, removed):
+        # Another process saved players.json since it was loaded: start
+        # from its file and apply the changes made here on top.
+        mine = {player.chess_id: player for player in changed}
+        self.players = [mine.get(player.chess_id, player)
+                        for player in Player.load_players()
+                        if player.chess_id not in removed]
+        saved = {player.chess_id for player in self.players}
+        self.players.extend(player for player in changed
+                            if player.chess_id not in saved)
+        self.players_by_id = {p.chess_id: p for p in self.players}
+        self.players_index = None
+
+
+class JsonStorage(JsonPlayerStorage):
+    # Tournaments live in the tournaments.json snapshot plus the journal,
+    # both guarded by one DataLock. Its version goes up with every write
+    # and its snapshot counter with every compaction, which tells a
+    # process whether it only has to replay the records others appended
+    # or has to reload everything.
+    def __init__(self, journal=None):
+        super().__init__()
+        self.journal = journal if journal is not None else Journal()
+        self.lock = DataLock('tournaments.json')
+        self.holding = False
+        # Whether this process wrote records since the last compaction.
+        self.dirty = False
+        with self.lock.hold() as lock:
+            self.state = lock.read()
+            self.tournaments = Tournament.load_tournaments(self.journal)
+        for tournament in self.tournaments:
+            tournament.journal = self
+
+    def list_tournaments(self):
+        return [summarize(tournament) for tournament in self.tournaments]
+
+    def load_tournament(self, tournament_id):
+        return next((t for t in self.tournaments
+                     if t.tournament_id == tournament_id), None)
+
+    def add_tournament(self, tournament):
+        self.tournaments.append(tournament)
+        tournament.journal = self
+        tournament.record('create', data=tournament.to_dict())
+
+    def append(self, record):
+        self.extend([record])
+
+    @contextmanager
+    def hold(self):
+        # Tournament.writing() wraps each change in this: the lock is
+        # taken and the tournaments caught up first, so the change is
+        # made on top of what other processes wrote and journaled before
+        # anyone else can write. Nested holds share the outer one.
+        if self.holding:
+            yield self
+            return
+        with self.lock.hold() as lock:
+            self.catch_up(lock.read())
+            self.holding = True
+            try:
+                yield self
+            finally:
+                self.holding = False
+
+    def extend(self, records):
+        # records are already applied to the tournaments here.
+        if self.holding:
+            self.journal.extend(records)
+            self.state = self.lock.bump()
+            self.dirty = True
+            return
+        # Applied without the lock, e.g. batched by the server: those
+        # that conflict with what other processes wrote meanwhile are
+        # undone and dropped.
+        with self.lock.hold() as lock:
+            rejected = self.catch_up(lock.read(), records)
+            if rejected:
+                dropped = set(map(id, rejected))
+                records = [record for record in records
+                           if id(record) not in dropped]
+            if records:
+                self.journal.extend(records)
+                self.state = lock.bump()
+                self.dirty = True
+        if rejected:
+            raise WriteConflict(f"{len(rejected)} changes conflicted with "
+                                "another process and were dropped.",
+                                rejected)
+
+    def catch_up(self, state, pending=()):
+        # Merges what other processes wrote since this one last looked.
+        # pending are records applied here but not written yet; returns
+        # those that conflict with what was written meanwhile.
+        rejected = []
+        if state.get('snapshot') != self.state.get('snapshot') or \
+                pending and state['version'] != self.state['version']:
+            # Replaying the others' records on top of pending changes
+            # could land them on the wrong round: start again from disk.
+            rejected = self.reload(pending)
+        elif state['version'] != self.state['version']:
+            created = Tournament.replay_records(
+                self.tournaments, self.journal.replay(self.journal.offset)
+            )
+            for tournament in created:
+                tournament.journal = self
+        self.state = state
+        return rejected
+
+    def reload(self, pending):
+        # Loads everything again, moving the fresh state into the
+        # existing objects so callers holding them stay in sync, then
+        # re-applies the pending records. Returns those that no longer
+        # apply.
+        ours = {t.tournament_id: t for t in self.tournaments}
+        self.tournaments = []
+        for tournament in Tournament.load_tournaments(self.journal):
+            current = ours.pop(tournament.tournament_id, None)
+            if current is None:
+                current = tournament
+                current.journal = self
+            else:
+                # Keep the journal, which may be a RecordBatch.
+                for slot in Tournament.__slots__:
+                    if slot != 'journal':
+                        setattr(current, slot, getattr(tournament, slot))
+            self.tournaments.append(current)
+        # Created here and not written yet: already up to date.
+        self.tournaments.extend(ours.values())
+        rejected = []
+        Tournament.replay_records(self.tournaments, [
+            record for record in pending if record['tournament'] not in ours
+        ], rejected)
+        return rejected
+
+    def checkpoint(self):
+        if len(self.journal) >= COMPACT_EVERY:
+            self.compact()
+
+    def compact(self):
+        with self.hold():
+            Tournament.save_tournaments(self.tournaments, self.journal)
+            self.state = self.lock.bump(
+                snapshot=self.state.get('snapshot', 0) + 1
+            )
+            self.dirty = False
+
+    def close(self):
+        # Compacting makes every other process reload, so a process that
+        # only read leaves the files alone.
+        if self.dirty:
+            self.compact()
+        self.journal.close()
+
+
+class ShardedStorage(JsonPlayerStorage):
+    # One JSON file per tournament plus manifest.json summarizing them,
+    # written under one DataLock so several processes can share the
+    # directory. A shard replaced by another process since this one read
+    # it is loaded again before being written, with this process's
+    # records replayed on top.
+    def __init__(self, directory='tournaments'):
+        super().__init__()
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self.loaded = {}
+        # The stamp of each loaded shard as it was read or last written.
+        self.stamps = {}
+        os.makedirs(directory, exist_ok=True)
+        self.lock = DataLock(self.manifest_path)
+        with self.lock.hold() as lock:
+            if not os.path.exists(self.manifest_path):
+                self.split_snapshot()
+            self.state = lock.read()
+            self.read_manifest()
+
+    def split_snapshot(self):
+        if not os.path.exists('tournaments.json'):
+            return
+        journal = Journal()
+        manifest = []
+        for tournament in Tournament.load_tournaments(journal):
+            manifest.append(summarize(tournament))
+            self.save_shard(tournament)
+        journal.close()
+        atomic_dump([entry._asdict() for entry in manifest],
+                    self.manifest_path)
+
+    def read_manifest(self):
+        self.manifest = []
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                self.manifest = [TournamentSummary(**entry)
+                                 for entry in json.load(f)]
+        self.positions = {entry.tournament_id: i
+                          for i, entry in enumerate(self.manifest)}
+
+    def catch_up(self, state):
+        # Only call while holding the lock.
+        if state['version'] != self.state['version']:
+            self.read_manifest()
+        self.state = state
+
+    def shard_path(self, tournament_id):
+        return os.path.join(self.directory, f'{tournament_id}.json')
+
+    def shard_stamp(self, tournament_id):
+        # Every write replaces the shard with a new file, so this changes
+        # with each one. None when there is no shard yet.
+        try:
+            status = os.stat(self.shard_path(tournament_id))
+        except FileNotFoundError:
+            return None
+        return status.st_ino, status.st_mtime_ns, status.st_size
+
+    def read_shard(self, tournament_id):
+        # Stamped before reading: a write in between only makes the
+        # shard look stale, and it is read once more.
+        stamp = self.shard_stamp(tournament_id)
+        if stamp is None:
+            return None, None
+        with open(self.shard_path(tournament_id), 'r') as f:
+            return Tournament.from_dict(json.load(f)), stamp
+
+    def save_shard(self, tournament):
+        atomic_dump(tournament.to_dict(),
+                    self.shard_path(tournament.tournament_id))
+
+    def save_manifest(self):
+        atomic_dump([entry._asdict() for entry in self.manifest],
+                    self.manifest_path)
+
+    def list_tournaments(self):
+        with self.lock.hold() as lock:
+            self.catch_up(lock.read())
+        return list(self.manifest)
+
+    def load_tournament(self, tournament_id):
+        tournament = self.loaded.get(tournament_id)
+        if tournament is None:
+            tournament, stamp = self.read_shard(tournament_id)
+            if tournament is None:
+                return None
+            tournament.journal = self
+            self.loaded[tournament_id] = tournament
+            self.stamps[tournament_id] = stamp
+        return tournament
+
+    def add_tournament(self, tournament):
+        self.loaded[tournament.tournament_id] = tournament
+        tournament.journal = self
+        tournament.record('create', data=tournament.to_dict())
+
+    def append(self, record):
+        self.extend([record])
+
+    def extend(self, records):
+        # records are already applied to the loaded tournaments. Each
+        # touched shard is written once however many records it got.
+        pending = {}
+        for record in records:
+            pending.setdefault(record['tournament'], []).append(record)
+        rejected = []
+        with self.lock.hold() as lock:
+            self.catch_up(lock.read())
+            changed = False
+            for tournament_id, shard_records in pending.items():
+                tournament = self.loaded[tournament_id]
+                if self.shard_stamp(tournament_id) != \
+                        self.stamps.get(tournament_id):
+                    rejected.extend(self.reload(tournament, shard_records))
+                self.save_shard(tournament)
+                self.stamps[tournament_id] = self.shard_stamp(tournament_id)
+
+                summary = summarize(tournament)
+                position = self.positions.get(tournament_id)
+                if position is None:
+                    self.positions[tournament_id] = len(self.manifest)
+                    self.manifest.append(summary)
+                elif self.manifest[position] != summary:
+                    self.manifest[position] = summary
+                else:
+                    continue
+                changed = True
+            if changed:
+                self.save_manifest()
+                self.state = lock.bump()
+        if rejected:
+            raise WriteConflict(f"{len(rejected)} changes conflicted with "
+                                "another process and were dropped.",
+                                rejected)
+
+    def reload(self, tournament, records):
+        # Moves the shard on disk into the loaded tournament and replays
+        # records over it. Returns those that no longer apply.
+        fresh, _ = self.read_shard(tournament.tournament_id)
+        for slot in Tournament.__slots__:
+            if slot != 'journal':
+                setattr(tournament, slot, getattr(fresh, slot))
+        rejected = []
+        Tournament.replay_records([tournament], records, rejected)
+        return rejected
+
+    def checkpoint(self):
+        pass
+
+    def close(self):
+        # Every write already saved its shard and the manifest.
+        pass
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS players (
+    chess_id TEXT PRIMARY KEY,
+    last_name TEXT NOT NULL,
+    first_name TEXT NOT NULL,
+    birth_date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_players_last_name ON players (last_name);
+
+CREATE TABLE IF NOT EXISTS tournaments (
+    position INTEGER PRIMARY KEY AUTOINCREMENT,
+    tournament_id TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    location TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    num_rounds INTEGER NOT NULL,
+    current_round INTEGER NOT NULL,
+    pairing_system TEXT NOT NULL DEFAULT 'swiss'
+);
+
+CREATE TABLE IF NOT EXISTS tournament_players (
+    tournament_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    chess_id TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    first_name TEXT NOT NULL,
+    birth_date TEXT NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (tournament_id, chess_id)
+);
+
+CREATE TABLE IF NOT EXISTS rounds (
+    tournament_id TEXT NOT NULL,
+    round_num INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    start_datetime TEXT,
+    end_datetime TEXT,
+    seed INTEGER,
+    PRIMARY KEY (tournament_id, round_num)
+);
+
+CREATE TABLE IF NOT EXISTS matches (
+    tournament_id TEXT NOT NULL,
+    round_num INTEGER NOT NULL,
+    match_num INTEGER NOT NULL,
+    player1 TEXT NOT NULL,
+    score1 REAL NOT NULL,
+    player2 TEXT,
+    score2 REAL,
+    PRIMARY KEY (tournament_id, round_num, match_num)
+);
+'''
+
+TOURNAMENT_FIELDS = ('name', 'location', 'start_date', 'end_date',
+                     'num_rounds', 'current_round', 'pairing_system')
+
+
+def _number(value):
+    return int(value) if value == int(value) else value
+
+
+class SQLiteStorage:
+    def __init__(self, path='chess.db'):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.add_missing_columns()
+
+    def add_missing_columns(self):
+        columns = {row[1] for row in
+                   self.connection.execute('PRAGMA table_info(rounds)')}
+        if 'seed' not in columns:
+            with self.connection:
+                self.connection.execute(
+                    'ALTER TABLE rounds ADD COLUMN seed INTEGER'
+                )
+        columns = {row[1] for row in
+                   self.connection.execute('PRAGMA table_info(tournaments)')}
+        if 'pairing_system' not in columns:
+            with self.connection:
+                self.connection.execute(
+                    'ALTER TABLE tournaments ADD COLUMN pairing_system TEXT '
+                    "NOT NULL DEFAULT 'swiss'"
+                )
+
+    def iter_players(self, offset=0, limit=None, search=None):
+        # Paged through idx_players_last_name; LIMIT -1 means no limit.
+        where = ''
+        parameters = []
+        if search:
+            pattern = '%' + re.sub(r'([\\%_])', r'\\\1', search) + '%'
+            where = ("WHERE last_name LIKE ? ESCAPE '\\' "
+                     "OR first_name LIKE ? ESCAPE '\\' "
+                     "OR chess_id LIKE ? ESCAPE '\\' ")
+            parameters = [pattern] * 3
+        cursor = self.connection.execute(
+            'SELECT last_name, first_name, birth_date, chess_id '
+            f'FROM players {where}ORDER BY last_name LIMIT ? OFFSET ?',
+            parameters + [-1 if limit is None else limit, offset]
+        )
+        for row in cursor:
+            yield Player(*row)
+
+    def get_player(self, chess_id):
+        row = self.connection.execute(
+            'SELECT last_name, first_name, birth_date, chess_id '
+            'FROM players WHERE chess_id = ?', (chess_id,)
+        ).fetchone()
+        return Player(*row) if row else None
+
+    def get_players(self, chess_ids):
+        chess_ids = list(chess_ids)
+        players = {}
+        for start in range(0, len(chess_ids), LOOKUP_BATCH):
+            batch = chess_ids[start:start + LOOKUP_BATCH]
+            for row in self.connection.execute(
+                'SELECT last_name, first_name, birth_date, chess_id '
+                'FROM players WHERE chess_id IN '
+                f'({", ".join("?" * len(batch))})', batch
+            ):
+                players[row[3]] = Player(*row)
+        return players
+
+    def add_player(self, player):
+        self.add_players([player])
+
+    def add_players(self, players):
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO players '
+                '(last_name, first_name, birth_date, chess_id) '
+                'VALUES (?, ?, ?, ?)',
+                ((p.last_name, p.first_name, p.birth_date, p.chess_id)
+                 for p in players)
+            )
+
+    def import_players(self, chunks):
+        # One transaction for the whole import; rows that would not change
+        # are left alone, so total_changes only counts real upserts.
+        with self.connection:
+            count = 'SELECT COUNT(*) FROM players'
+            before = self.connection.execute(count).fetchone()[0]
+            changes = self.connection.total_changes
+            for chunk in chunks:
+                self.connection.executemany(
+                    'INSERT INTO players '
+                    '(last_name, first_name, birth_date, chess_id) '
+                    'VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (chess_id) DO UPDATE SET '
+                    'last_name = excluded.last_name, '
+                    'first_name = excluded.first_name, '
+                    'birth_date = excluded.birth_date '
+                    'WHERE last_name IS NOT excluded.last_name '
+                    'OR first_name IS NOT excluded.first_name '
+                    'OR birth_date IS NOT excluded.birth_date',
+                    ((p.last_name, p.first_name, p.birth_date, p.chess_id)
+                     for p in chunk)
+                )
+            added = self.connection.execute(count).fetchone()[0] - before
+            changes = self.connection.total_changes - changes
+        return added, changes - added
+
+    def update_player(self, chess_id, player):
+        with self.connection:
+            self.connection.execute(
+                'UPDATE players SET last_name = ?, first_name = ?, '
+                'birth_date = ?, chess_id = ? WHERE chess_id = ?',
+                (player.last_name, player.first_name, player.birth_date,
+                 player.chess_id, chess_id)
+            )
+
+    def list_tournaments(self):
+        cursor = self.connection.execute(
+            'SELECT t.tournament_id, t.name, t.location, t.start_date, '
+            't.end_date, t.num_rounds, '
+            '(SELECT COUNT(*) FROM rounds r '
+            ' WHERE r.tournament_id = t.tournament_id), '
+            '(SELECT COUNT(*) FROM rounds r '
+            ' WHERE r.tournament_id = t.tournament_id '
+            ' AND r.end_datetime IS NULL) '
+            'FROM tournaments t ORDER BY t.position'
+        )
+        return [
+            TournamentSummary(*row[:5],
+                              tournament_status(row[5], row[6], row[7]))
+            for row in cursor
+        ]
+
+    def load_tournament(self, tournament_id):
+        row = self.connection.execute(
+            'SELECT name, location, start_date, end_date, num_rounds, '
+            'current_round, pairing_system FROM tournaments '
+            'WHERE tournament_id = ?', (tournament_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        tournament = Tournament(*row[:6], tournament_id=tournament_id,
+                                pairing_system=row[6])
+        players = {}
+        for chess_id, last_name, first_name, birth_date, score in \
+                self.connection.execute(
+                    'SELECT chess_id, last_name, first_name, birth_date, '
+                    'score FROM tournament_players WHERE tournament_id = ? '
+                    'ORDER BY position', (tournament_id,)):
+            players[chess_id] = TournamentEntry.from_dict({
+                'last_name': last_name,
+                'first_name': first_name,
+                'birth_date': birth_date,
+                'chess_id': chess_id,
+                'score': _number(score),
+            })
+        tournament.players = list(players.values())
+
+        for name, start_datetime, end_datetime, seed in \
+                self.connection.execute(
+                    'SELECT name, start_datetime, end_datetime, seed '
+                    'FROM rounds WHERE tournament_id = ? '
+                    'ORDER BY round_num', (tournament_id,)):
+            tournament.rounds.append(Round(name, start_datetime,
+                                           end_datetime, seed=seed))
+
+        for round_num, player1, score1, player2, score2 in \
+                self.connection.execute(
+                    'SELECT round_num, player1, score1, player2, score2 '
+                    'FROM matches WHERE tournament_id = ? '
+                    'ORDER BY round_num, match_num', (tournament_id,)):
+            for chess_id in (player1, player2):
+                if chess_id is not None and chess_id not in players:
+                    tournament.recover_player(chess_id, players)
+            if player2 is None:
+                # Full point byes used to be stored without score2.
+                match = Match(players[player1], None, _number(score1),
+                              _number(score2 or 0))
+            else:
+                match = Match(players[player1], players[player2],
+                              _number(score1), _number(score2))
+            tournament.rounds[round_num].matches.append(match)
+
+        tournament.journal = self
+        return tournament
+
+    def add_tournament(self, tournament):
+        tournament.journal = self
+        tournament.record('create', data=tournament.to_dict())
+
+    def append(self, record):
+        self.extend([record])
+
+    def extend(self, records):
+        # One transaction for the batch, and a savepoint per record so a
+        # stale one is dropped without the others.
+        rejected = []
+        with self.connection:
+            if not self.connection.in_transaction:
+                self.connection.execute('BEGIN IMMEDIATE')
+            for record in records:
+                self.connection.execute('SAVEPOINT record')
+                try:
+                    getattr(self, '_apply_' + record['op'])(
+                        record['tournament'], record
+                    )
+                except WriteConflict:
+                    self.connection.execute('ROLLBACK TO record')
+                    rejected.append(record)
+                self.connection.execute('RELEASE record')
+        if rejected:
+            raise WriteConflict(f"{len(rejected)} changes conflicted with "
+                                "another process and were dropped.",
+                                rejected)
+
+    def _apply_create(self, tournament_id, record):
+        data = record['data']
+        self.connection.execute(
+            'INSERT INTO tournaments (tournament_id, name, location, '
+            'start_date, end_date, num_rounds, current_round, '
+            'pairing_system) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (tournament_id,) + tuple(data[f] for f in TOURNAMENT_FIELDS[:-1])
+            + (data.get('pairing_system', 'swiss'),)
+        )
+        self._insert_players(tournament_id, data['players'])
+        for round_num, round_data in enumerate(data['rounds']):
+            self._insert_round(tournament_id, round_num, round_data)
+
+    def _apply_update(self, tournament_id, record):
+        fields = {f: v for f, v in record['fields'].items()
+                  if f in TOURNAMENT_FIELDS}
+        if not fields:
+            return
+        self.connection.execute(
+            'UPDATE tournaments SET '
+            + ', '.join(f'{f} = ?' for f in fields)
+            + ' WHERE tournament_id = ?',
+            tuple(fields.values()) + (tournament_id,)
+        )
+
+    def _apply_register(self, tournament_id, record):
+        self.connection.execute(
+            'DELETE FROM tournament_players WHERE tournament_id = ?',
+            (tournament_id,)
+        )
+        self._insert_players(tournament_id, record['players'])
+
+    def _apply_round(self, tournament_id, record):
+        round_num = self.connection.execute(
+            'SELECT COUNT(*) FROM rounds WHERE tournament_id = ?',
+            (tournament_id,)
+        ).fetchone()[0]
+        if record.get('round_num', round_num) != round_num:
+            raise WriteConflict(f"Round {record['round_num'] + 1} of "
+                                f"{tournament_id} was already paired "
+                                "elsewhere.")
+        self._insert_round(tournament_id, round_num, record['round'])
+
+    def _apply_result(self, tournament_id, record):
+        key = (tournament_id, record['round'], record['match'])
+        player1, score1, player2, score2 = self.connection.execute(
+            'SELECT player1, score1, player2, score2 FROM matches '
+            'WHERE tournament_id = ? AND round_num = ? AND match_num = ?',
+            key
+        ).fetchone()
+        if record.get('pairing', [player1, player2]) != [player1, player2]:
+            raise WriteConflict(f"Board {record['match'] + 1} of round "
+                                f"{record['round'] + 1} is no longer "
+                                f"{' - '.join(map(str, record['pairing']))}.")
+        points1, points2 = RESULT_POINTS[record['result']]
+        self.connection.execute(
+            'UPDATE matches SET score1 = ?, score2 = ? '
+            'WHERE tournament_id = ? AND round_num = ? AND match_num = ?',
+            (points1, points2) + key
+        )
+        self.connection.executemany(
+            'UPDATE tournament_players SET score = score + ? '
+            'WHERE tournament_id = ? AND chess_id = ?',
+            [(new - old, tournament_id, chess_id)
+             for chess_id, old, new in ((player1, score1, points1),
+                                        (player2, score2, points2))
+             if chess_id is not None]
+        )
+
+    def _apply_end_round(self, tournament_id, record):
+        self.connection.execute(
+            'UPDATE rounds SET end_datetime = ? '
+            'WHERE tournament_id = ? AND round_num = ?',
+            (record['end_datetime'], tournament_id, record['round'])
+        )
+
+    def _insert_players(self, tournament_id, players):
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO tournament_players (tournament_id, '
+            'position, chess_id, last_name, first_name, birth_date, score) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(tournament_id, position, p['chess_id'], p['last_name'],
+              p['first_name'], p['birth_date'], p['score'])
+             for position, p in enumerate(players)]
+        )
+
+    def _insert_round(self, tournament_id, round_num, round_data):
+        self.connection.execute(
+            'INSERT INTO rounds (tournament_id, round_num, name, '
+            'start_datetime, end_datetime, seed) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (tournament_id, round_num, round_data['name'],
+             round_data.get('start_datetime'),
+             round_data.get('end_datetime'), round_data.get('seed'))
+        )
+        rows = []
+        for match_num, (player1, player2, result) in \
+                enumerate(round_data['pairings']):
+            score1, score2 = RESULT_POINTS.get(result, (0, 0))
+            rows.append((tournament_id, round_num, match_num,
+                         player1, score1, player2, score2))
+        self.connection.executemany(
+            'INSERT INTO matches (tournament_id, round_num, match_num, '
+            'player1, score1, player2, score2) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)', rows
+        )
+
+    def checkpoint(self):
+        pass
+
+    def close(self):
+        self.connection.close()
+
+
+def open_storage(path=None):
+    if path is None:
+        return JsonStorage()
+    if path.endswith('.db'):
+        return SQLiteStorage(path)
+    return ShardedStorage(path)
+
+
+def migrate(source, target):
+    target.add_players(source.iter_players())
+    for summary in source.list_tournaments():
+        target.add_tournament(source.load_tournament(summary.tournament_id))
@@ -0,0 +1,184 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+from journal import RecordBatch
+from models import Match, Round, Tournament, TournamentEntry, WriteConflict
+from storage import JsonStorage
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run by the other process: pairs the next round of the only tournament,
+# then closes the storage, which compacts it, or only its journal.
+PAIR_ELSEWHERE = '''
+import sys
+from datetime import datetime
+from models import Round
+from storage import JsonStorage
+
+storage = JsonStorage()
+tournament = storage.tournaments[0]
+tournament.add_round(Round(f"Round {len(tournament.rounds) + 1}",
+                           datetime.now().isoformat(),
+                           matches=tournament.generate_next_matches()))
+if sys.argv[1] == 'compact':
+    storage.close()
+else:
+    storage.journal.close()
+'''
+
+
+def next_round(tournament):
+    return Round(f"Round {len(tournament.rounds) + 1}",
+                 datetime.now().isoformat(),
+                 matches=tournament.generate_next_matches())
+
+
+class TwoProcessJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        storage = JsonStorage()
+        tournament = Tournament('Open', 'Paris', '2024-01-01', '2024-01-02',
+                                4)
+        storage.add_tournament(tournament)
+        tournament.register([
+            TournamentEntry(f'Last{i}', f'First{i}', '2000-01-01',
+                            f'AB{i:05}')
+            for i in range(16)
+        ])
+        storage.close()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def pair_elsewhere(self, how):
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        subprocess.run([sys.executable, '-c', PAIR_ELSEWHERE, how],
+                       check=True, env=env)
+
+    def reopen(self):
+        storage = JsonStorage()
+        self.addCleanup(storage.journal.close)
+        return storage.tournaments[0]
+
+    def check_round_taken(self, how):
+        storage = JsonStorage()
+        self.addCleanup(storage.journal.close)
+        tournament = storage.tournaments[0]
+        self.pair_elsewhere(how)
+
+        with self.assertRaises(WriteConflict):
+            tournament.add_round(next_round(tournament))
+        # Caught up on the other process's round instead.
+        self.assertEqual([r.name for r in tournament.rounds], ['Round 1'])
+
+        # Results land on the pairings the other process wrote.
+        boards = len(tournament.rounds[0].matches)
+        tournament.enter_results(0, [(board, '1')
+                                     for board in range(1, boards + 1)])
+        reloaded = self.reopen()
+        self.assertEqual([r.name for r in reloaded.rounds], ['Round 1'])
+        self.assertEqual(
+            [match.to_list() for match in reloaded.rounds[0].matches],
+            [match.to_list() for match in tournament.rounds[0].matches]
+        )
+        self.assertEqual(sum(p.score for p in reloaded.players), boards)
+        self.assertIsNotNone(reloaded.rounds[0].end_datetime)
+
+    def test_round_paired_elsewhere_is_refused(self):
+        self.check_round_taken('journal')
+
+    def test_round_paired_elsewhere_after_compaction_is_refused(self):
+        self.check_round_taken('compact')
+
+    def test_stale_batched_round_is_dropped(self):
+        # A batch applied without the lock, like the server's, that comes
+        # out stale when it is written.
+        storage = JsonStorage()
+        self.addCleanup(storage.journal.close)
+        tournament = storage.tournaments[0]
+        batch = tournament.journal = RecordBatch(storage)
+        round_data = next_round(tournament)
+        # Colours the other way round from what the other process pairs.
+        round_data.matches = [Match(match.player2, match.player1)
+                              for match in round_data.matches]
+        tournament.add_round(round_data)
+        tournament.record_result(0, 0, '1')
+        self.pair_elsewhere('journal')
+
+        with self.assertRaises(WriteConflict):
+            batch.flush()
+        self.assertEqual(len(tournament.rounds), 1)
+        self.assertEqual(sum(p.score for p in tournament.players), 0)
+        reloaded = self.reopen()
+        self.assertEqual(len(reloaded.rounds), 1)
+        self.assertEqual(sum(p.score for p in reloaded.players), 0)
+
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def open_storage(self):
+        storage = JsonStorage()
+        self.addCleanup(storage.journal.close)
+        return storage
+
+    def test_legacy_tournament_keeps_its_journal(self):
+        # A snapshot from before tournaments had ids, changed and left
+        # without compacting, as after a crash.
+        data = Tournament('Open', 'Paris', '2024-01-01', '2024-01-02',
+                          4).to_dict()
+        del data['tournament_id']
+        with open('tournaments.json', 'w') as f:
+            json.dump([data], f)
+        storage = self.open_storage()
+        tournament_id = storage.tournaments[0].tournament_id
+        storage.tournaments[0].update(name='Renamed')
+
+        reloaded = self.open_storage().tournaments
+        self.assertEqual([(t.tournament_id, t.name) for t in reloaded],
+                         [(tournament_id, 'Renamed')])
+
+    def test_crash_between_snapshot_and_journal_clear(self):
+        storage = self.open_storage()
+        tournament = Tournament('Open', 'Paris', '2024-01-01', '2024-01-02',
+                                4)
+        storage.add_tournament(tournament)
+        tournament.register([
+            TournamentEntry(f'Last{i}', f'First{i}', '2000-01-01',
+                            f'AB{i:05}')
+            for i in range(16)
+        ])
+        tournament.add_round(next_round(tournament))
+        with open('tournaments.journal', 'rb') as f:
+            journal = f.read()
+        storage.compact()
+        # The journal as it was before the compaction cleared it.
+        with open('tournaments.journal', 'wb') as f:
+            f.write(journal)
+
+        reloaded = self.open_storage().tournaments
+        self.assertEqual(len(reloaded), 1)
+        self.assertEqual(len(reloaded[0].players), 16)
+        self.assertEqual([r.name for r in reloaded[0].rounds], ['Round 1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from random import Random
+
+from matching import max_weight_matching
+
+
+def brute_force(n, weights, maxcardinality):
+    # Best (cardinality, weight) or (weight,) over every matching of the
+    # vertices 0..n-1, trying all of them.
+    def best(free):
+        if not free:
+            return (0, 0)
+        v, rest = free[0], free[1:]
+        # v left unmatched.
+        options = [best(rest)]
+        for u in rest:
+            if (v, u) in weights:
+                count, weight = best(tuple(x for x in rest if x != u))
+                options.append((count + 1, weight + weights[v, u]))
+        if maxcardinality:
+            return max(options)
+        return max(options, key=lambda option: option[1])
+    count, weight = best(tuple(range(n)))
+    return (count, weight) if maxcardinality else (weight,)
+
+
+def matching_value(n, weights, mate, maxcardinality):
+    mate = mate + [-1] * (n - len(mate))
+    count = weight = 0
+    for v, u in enumerate(mate):
+        if u == -1:
+            continue
+        assert mate[u] == v, "mate is not symmetric"
+        assert (min(u, v), max(u, v)) in weights, "not an edge"
+        if v < u:
+            count += 1
+            weight += weights[v, u]
+    return (count, weight) if maxcardinality else (weight,)
+
+
+class MaxWeightMatchingTest(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(max_weight_matching([]), [])
+
+    def test_against_brute_force(self):
+        rng = Random(0)
+        for _ in range(500):
+            n = rng.randint(2, 9)
+            density = rng.random()
+            weights = {}
+            for i in range(n):
+                for j in range(i + 1, n):
+                    if rng.random() < density:
+                        weights[i, j] = rng.randint(-5, 30)
+            if not weights:
+                continue
+            edges = [(i, j, w) if rng.random() < 0.5 else (j, i, w)
+                     for (i, j), w in weights.items()]
+            rng.shuffle(edges)
+            for maxcardinality in (False, True):
+                mate = max_weight_matching(edges, maxcardinality)
+                with self.subTest(edges=edges,
+                                  maxcardinality=maxcardinality):
+                    self.assertEqual(
+                        matching_value(n, weights, mate, maxcardinality),
+                        brute_force(n, weights, maxcardinality)
+                    )
+
+
+if __name__ == '__main__':
+    unittest.main()
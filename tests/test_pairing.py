@@ -0,0 +1,103 @@
+import unittest
+from random import Random
+
+from pairing import swiss_pairings
+
+
+# Fields up to this size are checked against every possible pairing.
+BRUTE_FORCE_PLAYERS = 11
+
+
+def clean_pairing_exists(players, met, byes):
+    # Whether the players can be paired without a rematch, giving the
+    # bye, if one is needed, to someone who has not had it.
+    def pair(free):
+        if not free:
+            return True
+        first, rest = free[0], free[1:]
+        return any(pair(tuple(p for p in rest if p != other))
+                   for other in rest if frozenset((first, other)) not in met)
+    if len(players) % 2 == 0:
+        return pair(tuple(players))
+    return any(pair(tuple(p for p in players if p != bye))
+               for bye in players if bye not in byes)
+
+
+class SwissPairingsTest(unittest.TestCase):
+    def play(self, rng, n, rounds, bracket_size=None):
+        # Pairs and plays rounds with random results, checking every
+        # pairing on the way. Brackets smaller than the default can be
+        # forced into a rematch the whole field could avoid, so only
+        # the default ones are held to avoiding them.
+        scores = [0] * n
+        colors = [0] * n
+        met = set()
+        byes = set()
+        options = {} if bracket_size is None else \
+            {'bracket_size': bracket_size}
+        for round_num in range(rounds):
+            avoidable = clean_pairing_exists(range(n), met, byes) \
+                if n <= BRUTE_FORCE_PLAYERS else True
+            pairs, bye = swiss_pairings(
+                scores, lambda i, j: frozenset((i, j)) in met, colors,
+                byes.__contains__, **options
+            )
+
+            seen = [i for pair in pairs for i in pair]
+            if bye is not None:
+                seen.append(bye)
+            self.assertEqual(sorted(seen), list(range(n)))
+            self.assertEqual(bye is not None, n % 2 == 1)
+            if avoidable and bracket_size is None:
+                self.assertFalse(
+                    [pair for pair in pairs if frozenset(pair) in met],
+                    f"avoidable rematch in round {round_num + 1}"
+                )
+                self.assertNotIn(bye, byes,
+                                 f"avoidable second bye in round "
+                                 f"{round_num + 1}")
+
+            for white, black in pairs:
+                met.add(frozenset((white, black)))
+                colors[white] += 1
+                colors[black] -= 1
+                points = rng.choice((0, 0.5, 1))
+                scores[white] += points
+                scores[black] += 1 - points
+            if bye is not None:
+                byes.add(bye)
+                scores[bye] += 1
+
+    def test_first_round_pairs_top_half_with_bottom_half(self):
+        pairs, bye = swiss_pairings([0] * 17, lambda i, j: False,
+                                    [0] * 17, lambda i: False)
+        self.assertEqual(sorted(map(sorted, pairs)),
+                         [[i, i + 8] for i in range(8)])
+        self.assertEqual(bye, 16)
+
+    def test_small_fields_against_brute_force(self):
+        rng = Random(1)
+        for _ in range(150):
+            n = rng.randint(2, BRUTE_FORCE_PLAYERS)
+            with self.subTest(players=n):
+                self.play(rng, n, rng.randint(1, n - 1))
+
+    def test_large_fields(self):
+        # With fewer rounds than half the players, a pairing without
+        # rematches or a second bye always exists.
+        rng = Random(2)
+        for n in (25, 40, 64, 101):
+            with self.subTest(players=n):
+                self.play(rng, n, min(9, n // 2 - 2))
+
+    def test_small_brackets(self):
+        # Players floating down through many brackets still all get
+        # paired, with one bye at most.
+        rng = Random(3)
+        for n in (17, 40, 63):
+            with self.subTest(players=n):
+                self.play(rng, n, 9, bracket_size=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
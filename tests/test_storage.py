@@ -0,0 +1,99 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+from models import Round, Tournament, TournamentEntry, WriteConflict
+from storage import ShardedStorage
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run by the other process on the same directory of shards.
+ELSEWHERE = '''
+import sys
+from datetime import datetime
+from models import Round, Tournament
+from storage import ShardedStorage
+
+storage = ShardedStorage()
+if sys.argv[1] == 'create':
+    storage.add_tournament(Tournament('B', '', '', '', 4))
+else:
+    tournament = storage.load_tournament(sys.argv[2])
+    if sys.argv[1] == 'pair':
+        tournament.add_round(Round('Round 1', datetime.now().isoformat(),
+                                   matches=tournament.generate_next_matches()))
+    else:
+        tournament.record_result(0, 1, '2')
+storage.close()
+'''
+
+
+class ShardedStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def elsewhere(self, *args):
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        subprocess.run([sys.executable, '-c', ELSEWHERE] + list(args),
+                       check=True, env=env)
+
+    def registered(self, storage):
+        tournament = Tournament('A', '', '', '', 4)
+        storage.add_tournament(tournament)
+        tournament.register([
+            TournamentEntry(f'Last{i}', f'First{i}', '2000-01-01',
+                            f'AB{i:05}')
+            for i in range(16)
+        ])
+        return tournament
+
+    def test_tournaments_created_by_two_processes(self):
+        storage = ShardedStorage()
+        storage.list_tournaments()
+        self.elsewhere('create')
+        self.registered(storage)
+        storage.close()
+        self.assertEqual(
+            sorted(s.name for s in ShardedStorage().list_tournaments()),
+            ['A', 'B']
+        )
+
+    def test_results_entered_by_two_processes(self):
+        storage = ShardedStorage()
+        tournament = self.registered(storage)
+        tournament.add_round(Round('Round 1', datetime.now().isoformat(),
+                                   matches=tournament.generate_next_matches()))
+        self.elsewhere('result', tournament.tournament_id)
+        tournament.record_result(0, 0, '1')
+
+        reloaded = ShardedStorage().load_tournament(tournament.tournament_id)
+        self.assertEqual([match.result for match in
+                          reloaded.rounds[0].matches[:2]], ['1', '2'])
+        self.assertEqual(sum(p.score for p in reloaded.players), 2)
+
+    def test_round_paired_by_another_process_is_refused(self):
+        storage = ShardedStorage()
+        tournament = self.registered(storage)
+        self.elsewhere('pair', tournament.tournament_id)
+        with self.assertRaises(WriteConflict):
+            tournament.add_round(Round(
+                'Round 1', datetime.now().isoformat(),
+                matches=tournament.generate_next_matches()))
+        self.assertEqual(len(tournament.rounds), 1)
+        reloaded = ShardedStorage().load_tournament(tournament.tournament_id)
+        self.assertEqual(len(reloaded.rounds), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from models import Match, Round, Tournament, TournamentEntry
+from storage import JsonStorage, open_storage
+from trf import read_trf, write_trf
+
+
+def sample_tournament():
+    players = [TournamentEntry(f'Last{i}', f'First{i}', '2000-01-01',
+                               f'AB{i:05}')
+               for i in range(5)]
+    a, b, c, d, e = players
+    rounds = [
+        Round("Round 1", "2024-01-01", "2024-01-01", [
+            Match(a, b, 1, 0), Match(c, d, 0.5, 0.5),
+            Match(e, None, 0.5, 0.5),
+        ]),
+        Round("Round 2", "2024-01-02", "2024-01-02", [
+            Match(e, a, 0, 1), Match(b, c, 1, 0), Match(d, None, 0, 1),
+        ]),
+        Round("Round 3", "2024-01-03", "2024-01-03", [
+            Match(a, c, 0.5, 0.5), Match(d, e, 0, 1), Match(b, None, 1, 0),
+        ]),
+    ]
+    for round_data in rounds:
+        for match in round_data.matches:
+            match.player1.score += match.score1
+            if match.player2 is not None:
+                match.player2.score += match.score2
+    return Tournament('Open', 'Paris', '2024-01-01', '2024-01-03', 3,
+                      current_round=4, rounds=rounds, players=players)
+
+
+def export(tournament):
+    f = io.StringIO()
+    write_trf(tournament, f)
+    return f.getvalue()
+
+
+class TrfRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def test_byes_survive_storage(self):
+        text = export(sample_tournament())
+        self.assertIn("0000 - H", text)
+        self.assertIn("0000 - Z", text)
+        self.assertIn("0000 - U", text)
+        for path in (None, 'chess.db', 'shards'):
+            with self.subTest(storage=path or 'json'):
+                tournament = read_trf(io.StringIO(text))
+                storage = open_storage(path)
+                storage.add_tournament(tournament)
+                storage.close()
+
+                storage = open_storage(path)
+                loaded = storage.load_tournament(tournament.tournament_id)
+                self.assertEqual(
+                    [match.result for match in loaded.rounds[0].matches],
+                    ['1', '2', '2'])
+                self.assertEqual(export(loaded), text)
+                storage.close()
+
+    def test_bye_results_are_kept_by_the_journal(self):
+        tournament = read_trf(io.StringIO(export(sample_tournament())))
+        storage = JsonStorage()
+        storage.add_tournament(tournament)
+        storage.journal.close()
+
+        loaded = JsonStorage().load_tournament(tournament.tournament_id)
+        self.assertEqual(
+            [match.result for match in loaded.rounds[1].matches],
+            ['3', '1', '3'])
+
+    def test_forfeits_are_refused(self):
+        text = export(sample_tournament()).replace("    2 w 1", "    2 w +")
+        with self.assertRaises(ValueError):
+            read_trf(io.StringIO(text))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+TIEBREAKS = ('buchholz', 'median_buchholz', 'sonneborn_berger',
+             'cumulative')
+
+# No opponent in that round: a bye or a game without a result yet.
+NO_OPPONENT = -1
+
+
+def result_arrays(players, rounds):
+    # Flattens the rounds into two row-major players x rounds arrays: the
+    # index of each player's opponent and the points they scored.
+    index = {player.chess_id: i for i, player in enumerate(players)}
+    width = len(rounds)
+    opponents = array('i', [NO_OPPONENT]) * (len(players) * width)
+    points = array('d', [0.0]) * (len(players) * width)
+
+    for column, round_data in enumerate(rounds):
+        for match in round_data.matches:
+            if match.result is None:
+                continue
+            i = index[match.player1.chess_id]
+            points[i * width + column] = match.score1
+            if match.player2 is None:
+                continue
+            j = index[match.player2.chess_id]
+            points[j * width + column] = match.score2
+            opponents[i * width + column] = j
+            opponents[j * width + column] = i
+    return opponents, points
+
+
+def _numpy_tiebreaks(opponents, points, n, width):
+    opponents = numpy.frombuffer(opponents, dtype=numpy.intc)
+    opponents = opponents.reshape(n, width)
+    points = numpy.frombuffer(points, dtype=numpy.double).reshape(n, width)
+
+    scores = points.sum(axis=1)
+    played = opponents != NO_OPPONENT
+    opponent_scores = numpy.where(played, scores[opponents], 0.0)
+    buchholz = opponent_scores.sum(axis=1)
+
+    counts = played.sum(axis=1)
+    highest = numpy.where(played, opponent_scores, 0.0).max(axis=1)
+    lowest = numpy.where(played, opponent_scores, numpy.inf)
+    lowest = lowest.min(axis=1, initial=numpy.inf)
+    median = numpy.where(counts > 2, buchholz - highest - lowest, buchholz)
+
+    return {
+        'score': scores.tolist(),
+        'buchholz': buchholz.tolist(),
+        'median_buchholz': median.tolist(),
+        'sonneborn_berger': (opponent_scores * points).sum(axis=1).tolist(),
+        'cumulative': points.cumsum(axis=1).sum(axis=1).tolist(),
+    }
+
+
+def _array_tiebreaks(opponents, points, n, width):
+    scores = array('d', (sum(points[i * width:(i + 1) * width])
+                         for i in range(n)))
+    buchholz = array('d', [0.0]) * n
+    median = array('d', [0.0]) * n
+    sonneborn_berger = array('d', [0.0]) * n
+    cumulative = array('d', [0.0]) * n
+
+    for i in range(n):
+        row = i * width
+        total = running = progressive = weighted = 0.0
+        highest = lowest = None
+        counted = 0
+        for k in range(row, row + width):
+            running += points[k]
+            progressive += running
+            opponent = opponents[k]
+            if opponent == NO_OPPONENT:
+                continue
+            opponent_score = scores[opponent]
+            total += opponent_score
+            weighted += opponent_score * points[k]
+            counted += 1
+            if highest is None or opponent_score > highest:
+                highest = opponent_score
+            if lowest is None or opponent_score < lowest:
+                lowest = opponent_score
+        buchholz[i] = total
+        median[i] = total - highest - lowest if counted > 2 else total
+        sonneborn_berger[i] = weighted
+        cumulative[i] = progressive
+
+    return {
+        'score': scores.tolist(),
+        'buchholz': buchholz.tolist(),
+        'median_buchholz': median.tolist(),
+        'sonneborn_berger': sonneborn_berger.tolist(),
+        'cumulative': cumulative.tolist(),
+    }
+
+
+def compute_tiebreaks(players, rounds):
+    # Returns {name: [value per player]} for the score and every tie-break
+    # in TIEBREAKS, in the order of players.
+    opponents, points = result_arrays(players, rounds)
+    n, width = len(players), len(rounds)
+    if numpy is not None and n and width:
+        return _numpy_tiebreaks(opponents, points, n, width)
+    return _array_tiebreaks(opponents, points, n, width)
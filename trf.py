@@ -0,0 +1,173 @@
+import sys
+
+from models import Match, Round, Tournament, TournamentEntry
+
+# FIDE Tournament Report File (TRF16) support. Player lines ("001") are
+# fixed width; from ROUNDS_COLUMN on, each round takes ROUND_WIDTH
+# characters: two blanks, the opponent's starting rank, color and result.
+ROUNDS_COLUMN = 89
+ROUND_WIDTH = 10
+
+WIN_CODES = '1+WFU'
+DRAW_CODES = '=DH'
+# Forfeits were never played: imported as games they would be rated and
+# counted in the tie-breaks, so they are refused.
+FORFEIT_CODES = '+-'
+# Results written for the player with white, keyed by Match scores.
+RESULT_CODES = {(1, 0): ('1', '0'), (0.5, 0.5): ('=', '='),
+                (0, 1): ('0', '1')}
+# Full, half and zero point byes.
+BYE_CODES = {1: 'U', 0.5: 'H'}
+EMPTY_CELL = ' ' * ROUND_WIDTH
+
+
+def trf_date(date):
+    return date.replace('-', '/') if date else ''
+
+
+def iso_date(date):
+    return date.strip().replace('/', '-')
+
+
+def _points(code):
+    if code in WIN_CODES:
+        return 1
+    if code in DRAW_CODES:
+        return 0.5
+    return 0
+
+
+def write_trf(tournament, f):
+    # Streams the tournament out one line at a time. Only the round cells,
+    # one short string per player and round, are gathered beforehand.
+    players = tournament.players
+    width = len(tournament.rounds)
+    rank = {player.chess_id: i + 1 for i, player in enumerate(players)}
+    cells = [EMPTY_CELL] * (len(players) * width)
+
+    for column, round_data in enumerate(tournament.rounds):
+        for match in round_data.matches:
+            i = rank[match.player1.chess_id] - 1
+            if match.player2 is None:
+                cells[i * width + column] = \
+                    f"  0000 - {BYE_CODES.get(match.score1, 'Z')}"
+                continue
+            j = rank[match.player2.chess_id] - 1
+            white, black = RESULT_CODES.get((match.score1, match.score2),
+                                            (' ', ' '))
+            cells[i * width + column] = f"  {j + 1:>4} w {white}"
+            cells[j * width + column] = f"  {i + 1:>4} b {black}"
+
+    f.write(f"012 {tournament.name}\n")
+    f.write(f"022 {tournament.location}\n")
+    f.write(f"042 {trf_date(tournament.start_date)}\n")
+    f.write(f"052 {trf_date(tournament.end_date)}\n")
+    f.write(f"062 {len(players)}\n")
+    f.write(f"XXR {tournament.num_rounds}\n")
+    if tournament.rounds:
+        f.write("132" + " " * (ROUNDS_COLUMN - 3) + "".join(
+            f"  {trf_date(round_data.start_datetime[2:10]):<8}"
+            for round_data in tournament.rounds
+        ).rstrip() + "\n")
+
+    standings = tournament.standings
+    for i, player in enumerate(players):
+        name = f"{player.last_name}, {player.first_name}"
+        # Sex, title, rating and federation are left blank.
+        line = (f"001 {i + 1:>4}{'':6}{name[:33]:<33}{'':10}"
+                f"{player.chess_id[:11]:>11} "
+                f"{trf_date(player.birth_date)[:10]:<10} "
+                f"{player.score:>4.1f} "
+                f"{standings.rank(player.chess_id):>4}")
+        line += "".join(cells[i * width:(i + 1) * width])
+        f.write(line.rstrip() + "\n")
+
+
+def read_trf(f):
+    # Streams a TRF file into a Tournament. Player lines become entries
+    # as they are read; only their round columns are kept, as raw text,
+    # until every starting rank is known and the matches can be built.
+    header = {}
+    round_dates = []
+    players = []
+    columns = []
+    for line in f:
+        line = line.rstrip('\r\n')
+        code = line[:3]
+        if code == '001':
+            name = line[14:47].strip()
+            last_name, _, first_name = name.partition(',')
+            rank = line[4:8].strip()
+            chess_id = line[57:68].strip() or f'#{rank}'
+            entry = TournamentEntry(last_name.strip(), first_name.strip(),
+                                    iso_date(line[69:79]), chess_id)
+            points = line[80:84].strip()
+            entry.score = float(points) if points else 0
+            if entry.score == int(entry.score):
+                entry.score = int(entry.score)
+            players.append(entry)
+            columns.append(line[ROUNDS_COLUMN:])
+        elif code == '132':
+            round_dates = [line[k:k + 8].strip() for k in
+                           range(ROUNDS_COLUMN + 2, len(line),
+                                 ROUND_WIDTH)]
+        elif code in ('012', '022', '042', '052', 'XXR'):
+            header[code] = line[4:].strip()
+
+    num_columns = max(
+        (len(text) + ROUND_WIDTH - 1) // ROUND_WIDTH for text in columns
+    ) if columns else 0
+    rounds = []
+    for column in range(num_columns):
+        boards = []
+        complete = True
+        for i, text in enumerate(columns):
+            cell = text[column * ROUND_WIDTH:(column + 1) * ROUND_WIDTH]
+            opponent, color, code = cell[2:6].strip(), cell[7:8], \
+                cell[9:10].strip()
+            if not opponent.isdigit() or int(opponent) == 0:
+                if code:
+                    # A half or zero point bye keeps the rest of the point
+                    # as score2, so its result code tells them apart.
+                    points = _points(code)
+                    boards.append((i, Match(players[i], None,
+                                            points, 1 - points)))
+                continue
+            if code in FORFEIT_CODES:
+                raise ValueError(f"Player {i + 1} has a forfeit in round "
+                                 f"{column + 1}; forfeits are not "
+                                 "supported.")
+            if color != 'w':
+                continue
+            j = int(opponent) - 1
+            if code:
+                score1 = _points(code)
+                boards.append((min(i, j), Match(players[i], players[j],
+                                                score1, 1 - score1)))
+            else:
+                boards.append((min(i, j), Match(players[i], players[j])))
+                complete = False
+        if not boards:
+            continue
+        # Played games first in ranking order, byes last.
+        boards.sort(key=lambda board: (board[1].is_bye, board[0]))
+        date = iso_date('20' + round_dates[column]) \
+            if column < len(round_dates) and round_dates[column] else ''
+        rounds.append(Round(f"Round {column + 1}", date,
+                            date if complete else None,
+                            [match for _, match in boards]))
+
+    return Tournament(header.get('012', ''), header.get('022', ''),
+                      iso_date(header.get('042', '')),
+                      iso_date(header.get('052', '')),
+                      int(header.get('XXR') or len(rounds) or 4),
+                      current_round=len(rounds) + 1,
+                      rounds=rounds, players=players)
+
+
+if __name__ == '__main__':
+    # trf.py in.trf out.trf: reads a report and writes it back out.
+    with open(sys.argv[1], 'r', encoding='utf-8') as source:
+        tournament = read_trf(source)
+    with open(sys.argv[2], 'w', encoding='utf-8') as target:
+        write_trf(tournament, target)
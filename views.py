@@ -1,10 +1,16 @@
-from models import Player, Tournament
+import sys
 from datetime import datetime
 
+from importer import parse_chess_ids, parse_results
+from models import (PAIRING_SYSTEMS, Player, Round, SpeculativePairing,
+                    Tournament, TournamentEntry, WriteConflict)
+from rendering import Pager
+
 
 class View:
     def __init__(self, controller):
         self.controller = controller
+        self.pager = Pager()
 
     def display_menu(self):
         print("\nMenu:")
@@ -18,7 +24,8 @@ class View:
         print("8. See ongoing matches")
         print("9. Enter match results")
         print("10. Summary of rounds")
-        print("11. Exit")
+        print("11. Pair next round of all tournaments")
+        print("12. Exit")
 
     def get_user_choice(self):
         return input("Enter your choice: ")
@@ -31,27 +38,24 @@ class View:
 
         return Player(last_name, first_name, birth_date, chess_id)
 
-    def list_players(self, players):
-        if not players:
-            print("No players found.")
-            return
+    def player_list_options(self):
+        # Returns (search text or None, offset).
+        search = input("Filter by name or chess ID (leave blank for "
+                       "all): ").strip()
+        start = input("Start at player number (leave blank for 1): ").strip()
+        offset = int(start) - 1 if start.isdigit() and int(start) > 1 else 0
+        return search or None, offset
 
+    def list_players(self, players, start=1):
         print("List of players:")
-        for i, player in enumerate(sorted(players, key=lambda x: x.last_name),
-                                   start=1):
-            print(f"{i}. {player.last_name}, {player.first_name} "
-                  f"({player.chess_id})")
-
-    def modify_player(self, players):
-        self.list_players(players)
-        player_index = int(input("Enter the index of the player you want to "
-                                 "modify: ")) - 1
-
-        if player_index < 0 or player_index >= len(players):
-            print("Invalid player index.")
-            return
+        if not self.pager.show(
+            f"{i}. {player.last_name}, {player.first_name} "
+            f"({player.chess_id})"
+            for i, player in enumerate(players, start=start)
+        ):
+            print("No players found.")
 
-        player = players[player_index]
+    def modify_player(self, player):
         print(f"Modifying player: {player.last_name}, {player.first_name} "
               f"({player.chess_id})")
 
@@ -77,19 +81,17 @@ class View:
         start_date = input("Enter start date (YYYY-MM-DD): ")
         end_date = input("Enter end date (YYYY-MM-DD): ")
         num_rounds = int(input("Enter number of rounds (default 4): ") or 4)
+        pairing_system = None
+        while pairing_system not in PAIRING_SYSTEMS:
+            pairing_system = input(
+                "Enter pairing system (" + ", ".join(PAIRING_SYSTEMS)
+                + "; default swiss): "
+            ).strip() or 'swiss'
 
-        return Tournament(name, location, start_date, end_date, num_rounds)
+        return Tournament(name, location, start_date, end_date, num_rounds,
+                          pairing_system=pairing_system)
 
-    def modify_tournament(self, tournaments):
-        self.list_tournaments(tournaments)
-        tournament_index = int(input("Enter the index of the tournament you "
-                                     "want to modify: ")) - 1
-
-        if tournament_index < 0 or tournament_index >= len(tournaments):
-            print("Invalid tournament index.")
-            return
-
-        tournament = tournaments[tournament_index]
+    def modify_tournament(self, tournament):
         print(f"Modifying tournament: {tournament.name} "
               f"({tournament.location})")
 
@@ -112,11 +114,16 @@ class View:
             ) or tournament.num_rounds
         )
 
-        tournament.name = name
-        tournament.location = location
-        tournament.start_date = start_date
-        tournament.end_date = end_date
-        tournament.num_rounds = num_rounds
+        tournament.update(name=name, location=location,
+                          start_date=start_date, end_date=end_date,
+                          num_rounds=num_rounds)
+
+    def pairing_report(self, report, errors):
+        print(f"\nPaired {report.paired} of {report.sections} sections in "
+              f"{report.seconds:.2f}s "
+              f"({report.sections_per_second:.1f} sections/s).")
+        for tournament_id, error in errors.items():
+            print(f"Could not pair {tournament_id}: {error}")
 
     def list_tournaments(self, tournaments):
         if not tournaments:
@@ -128,109 +135,203 @@ class View:
             print(f"{i}. {tournament.name} ({tournament.location})")
 
     def register_players(self, tournament):
-        print("Select players to register (enter 'done' when finished):")
+        if tournament.rounds:
+            print(f"{tournament.name} has already started: players can no "
+                  "longer be registered.")
+            return
+
+        print("Select players to register: chess IDs separated by commas, "
+              "ranges such as AB00001-AB00020 or @file with IDs "
+              "(enter 'done' when finished):")
         registered_players = []
+        registered_ids = set()
         while True:
-            player_id = input("Enter player's chess IDs by comma: ").strip()
-            if player_id.lower() == 'done':
+            entry = input("Enter player's chess IDs by comma: ").strip()
+            if entry.lower() == 'done':
                 break
 
-            player = next((p for p in self.controller.players
-                           if p.chess_id == player_id), None)
-            if not player:
-                print(f"Player with ID {player_id} not found.")
+            try:
+                chess_ids = parse_chess_ids(entry)
+            except (ValueError, OSError) as e:
+                print(e)
                 continue
 
-            registered_players.append({
-                'last_name': player.last_name,
-                'first_name': player.first_name,
-                'birth_date': player.birth_date,
-                'chess_id': player.chess_id,
-                'score': 0
-            })
-
-        if len(registered_players) < 16:
-            print("At least 16 players are required to launch a tournament "
-                  "of 4 rounds.")
+            found = self.controller.find_players(chess_ids)
+            for chess_id in chess_ids:
+                player = found.get(chess_id)
+                if not player:
+                    print(f"Player with ID {chess_id} not found.")
+                elif chess_id in registered_ids:
+                    print(f"Player with ID {chess_id} is already "
+                          "registered.")
+                else:
+                    registered_ids.add(chess_id)
+                    registered_players.append(
+                        TournamentEntry.from_player(player)
+                    )
+            print(f"{len(registered_players)} players registered.")
+
+        if len(registered_players) < tournament.min_players:
+            print(f"At least {tournament.min_players} players are required "
+                  "to launch this tournament.")
             return
 
-        tournament.players = registered_players
+        tournament.register(registered_players)
 
     def launch_tournament(self, tournament):
-        if len(tournament.players) < 16:
-            print("At least 16 players are required to launch a tournament "
-                  "of 4 rounds.")
+        if len(tournament.players) < tournament.min_players:
+            print(f"At least {tournament.min_players} players are required "
+                  "to launch this tournament.")
             return
 
-        for round_num in range(tournament.num_rounds):
+        # Carries on from the rounds already played or paired, e.g. by
+        # the batch pairer; a round still open is played, not paired.
+        first_round = len(tournament.rounds)
+        if tournament.rounds and tournament.rounds[-1].end_datetime is None:
+            first_round -= 1
+
+        speculation = None
+        for round_num in range(first_round, tournament.num_rounds):
             round_name = f"Round {round_num + 1}"
             print(f"\n{round_name}")
 
-            matches = tournament.generate_swiss_system_matches()
-
-            round_data = {
-                'name': round_name,
-                'start_datetime': datetime.now().isoformat(),
-                'matches': matches,
-            }
-
-            tournament.rounds.append(round_data)
-
-            print(f"\n{round_data['name']}")
-            print(f"Start: {round_data['start_datetime']}")
+            if round_num < len(tournament.rounds):
+                # Paired elsewhere meanwhile: the speculation is moot.
+                if speculation is not None:
+                    speculation.close()
+                round_data = tournament.rounds[round_num]
+            else:
+                if speculation is not None:
+                    matches = speculation.matches()
+                else:
+                    matches = tournament.generate_next_matches()
+
+                round_data = Round(round_name, datetime.now().isoformat(),
+                                   matches=matches)
+
+                try:
+                    tournament.add_round(round_data)
+                except WriteConflict as e:
+                    print(e)
+                    return
+
+            print(f"\n{round_data.name}")
+            print(f"Start: {round_data.start_datetime}")
 
             print("\nMatches:")
-            for i, match in enumerate(round_data['matches'], start=1):
-                player1 = match[0][0]
-                player2 = match[1][0] if len(match) > 1 else None
-                match_info = "Match {}: {} {} ({}) vs. {} {} ({})".format(
-                    i, player1['first_name'],
-                    player1['last_name'], player1['score'],
-                    player2['first_name'],
-                    player2['last_name'], player2['score']
-                )
+            for i, match in enumerate(round_data.matches, start=1):
+                player1 = match.player1
+                player2 = match.player2
+                if match.is_bye:
+                    match_info = "Match {}: {} {} ({}) has a bye".format(
+                        i, player1.first_name, player1.last_name,
+                        player1.score
+                    )
+                else:
+                    match_info = "Match {}: {} {} ({}) vs. {} {} ({})".format(
+                        i, player1.first_name,
+                        player1.last_name, player1.score,
+                        player2.first_name,
+                        player2.last_name, player2.score
+                    )
                 print(match_info)
-            tournament.play_round(round_num)
+            speculation = None
+            if round_num + 1 < tournament.num_rounds and \
+                    tournament.pairing_system == 'swiss':
+                speculation = SpeculativePairing(tournament)
+            tournament.play_round(round_num, speculation)
 
-            print(f"\nEnd: {round_data['end_datetime']}")
+            print(f"\nEnd: {round_data.end_datetime}")
 
         print("\nTournament finished.")
-        winner = max(tournament.players, key=lambda x: x['score'])
-        print(f"The winner is {winner['first_name']} {winner['last_name']} "
-              f"({winner['chess_id']})")
+        winner = tournament.standings.leader()
+        print(f"The winner is {winner.first_name} {winner.last_name} "
+              f"({winner.chess_id})")
 
     def show_ongoing_matches(self, tournament):
         if tournament.rounds:
-            current_round = tournament.rounds[-1]
-            print(f"\nCurrent round: {current_round['name']}")
-            print("Matches:")
-            for i, match in enumerate(current_round['matches'], start=1):
-                print("Match {0}: {1} {2} vs. {3} {4}".format(
-                    i, match[0][0]['first_name'],
-                    match[0][0]['last_name'],
-                    match[1][0]['first_name'],
-                    match[1][0]['last_name']
-                ))
-
+            self.pager.show(self.ongoing_match_lines(tournament.rounds[-1]))
         else:
             print("No ongoing matches found.")
 
+    def ongoing_match_lines(self, current_round):
+        yield f"\nCurrent round: {current_round.name}"
+        yield "Matches:"
+        for i, match in enumerate(current_round.matches, start=1):
+            if match.is_bye:
+                yield "Match {0}: {1} {2} has a bye".format(
+                    i, match.player1.first_name, match.player1.last_name
+                )
+                continue
+            yield "Match {0}: {1} {2} vs. {3} {4}".format(
+                i, match.player1.first_name,
+                match.player1.last_name,
+                match.player2.first_name,
+                match.player2.last_name
+            )
+
     def enter_match_results(self, tournament):
         round_num = len(tournament.rounds) - 1
-        tournament.play_round(round_num)
+        path = input("Results file ('-' for standard input, leave blank to "
+                     "enter them one by one): ").strip()
+        if not path:
+            tournament.play_round(round_num)
+            return
+
+        try:
+            if path == '-':
+                results = parse_results(sys.stdin)
+            else:
+                with open(path, 'r') as f:
+                    results = parse_results(f)
+            missing = tournament.enter_results(round_num, results)
+        except (ValueError, OSError) as e:
+            print(f"No results entered:\n{e}")
+            return
+
+        print(f"{len(results)} results entered.")
+        if missing:
+            print("Boards still without a result: "
+                  + ", ".join(map(str, missing)))
+        else:
+            print("Round finished.")
 
     def summary_rounds(self, tournament):
-        for round_num, round_data in enumerate(tournament.rounds, start=1):
-            print(f"\n{round_data['name']}")
-            print(f"Start: {round_data['start_datetime']}")
-            print(f"End: {round_data['end_datetime']}")
+        self.pager.show(self.summary_lines(tournament))
 
-            print("\nMatches:")
-            for i, match in enumerate(round_data['matches'], start=1):
-                player1 = match[0][0]
-                player2 = match[1][0] if len(match) > 1 else None
-                print("Match {}: {} {} ({}), {} {} ({})".format(
+    def summary_lines(self, tournament):
+        for round_num, round_data in enumerate(tournament.rounds, start=1):
+            yield f"\n{round_data.name}"
+            yield f"Start: {round_data.start_datetime}"
+            yield f"End: {round_data.end_datetime}"
+
+            yield "\nMatches:"
+            for i, match in enumerate(round_data.matches, start=1):
+                player1 = match.player1
+                player2 = match.player2
+                if match.is_bye:
+                    yield "Match {}: {} {} ({}), bye".format(
+                        i, player1.first_name, player1.last_name,
+                        match.score1
+                    )
+                    continue
+                yield "Match {}: {} {} ({}), {} {} ({})".format(
                     i,
-                    player1['first_name'], player1['last_name'], match[0][1],
-                    player2['first_name'], player2['last_name'], match[1][1]
-                ))
+                    player1.first_name, player1.last_name, match.score1,
+                    player2.first_name, player2.last_name, match.score2
+                )
+
+        if tournament.rounds:
+            yield from self.standings_lines(tournament)
+
+    def standings_lines(self, tournament):
+        standings = tournament.standings
+        yield "\nStandings:"
+        yield ("Rank  Player                          Score    Bh   MBh"
+               "    SB   Cum")
+        for rank, player in enumerate(standings, start=1):
+            name = f"{player.first_name} {player.last_name}"
+            yield "{:>4}  {:<30} {:>6} {:>5} {:>5} {:>5} {:>5}".format(
+                rank, name[:30], player.score,
+                *(f"{value:g}" for value in standings.tiebreak(player))
+            )